@@ -3,9 +3,13 @@
 #  file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
-__all__ = ['Link', 'MoveType', 'Polymer', 'HERNIAS', 'HERNIA_PAIRS', 'TransitionMatrix']
+__all__ = ['Link', 'MoveType', 'Polymer', 'HERNIAS', 'HERNIA_PAIRS',
+           'PAIR_TRANSITIONS', 'CacheInfo', 'TransitionCache',
+           'TRANSITION_CACHE', 'TransitionMatrix', 'model_rates',
+           'pair_displacement']
 
 
+import collections
 import functools
 import operator
 
@@ -50,6 +54,20 @@ class Link(int):
             Link.SLACK: Link.SLACK,
         }[self]
 
+    def vector(self):
+        """L.vector() -> (x, y)
+
+        Returns the lattice displacement between the reptons the link joins,
+        with x growing to the right and y growing upwards.
+        """
+        return {
+            Link.UP: (0, 1),
+            Link.DOWN: (0, -1),
+            Link.LEFT: (-1, 0),
+            Link.RIGHT: (1, 0),
+            Link.SLACK: (0, 0),
+        }[self]
+
 
 Link.LINKS = {Link(i) for i in Link.VALID_LINK_VALUES}
 Link.UP, Link.DOWN, Link.LEFT, Link.RIGHT, Link.SLACK = Link.LINKS
@@ -106,13 +124,33 @@ MoveType.MOVE_TYPES = {MoveType(i) for i in MoveType.VALID_MOVE_TYPE_VALUES}
 ) = MoveType.MOVE_TYPES
 
 
+def model_rates(h, c):
+    """model_rates(h, c) -> dict with MoveType keys
+
+    Returns the rates of all kinds of moves for the parameters h and c, as
+    defined by van Leeuwen and Drzewinski in "Stochastic lattice models for
+    the dynamics of linear polymers". Reptation and end extension happen with
+    unit rate.
+    """
+    return {
+        MoveType.REPTATION: 1.0,
+        MoveType.HERNIA_CREATION: h,
+        MoveType.HERNIA_ANNIHILATION: h,
+        MoveType.HERNIA_REDIRECTION: h,
+        MoveType.BARRIER_CROSSING: c,
+        MoveType.END_EXTENSION: 1.0,
+        MoveType.END_CONTRACTION: h,
+        MoveType.END_WIGGLE: h,
+    }
+
+
 def at_end_pairs(move_type: MoveType):
-    """A decorator turning `Link -> set of Links` functions into `Polymer`
-    methods that transform the end links of a chain.
+    """A decorator turning `Link -> set of Links` functions into link pair
+    transformers that only change the end links of a chain.
     """
     def decorator(f):
         @functools.wraps(f)
-        def wrapper(self, p, pair):
+        def wrapper(pair):
             if not Polymer.is_edge_pair(pair):
                 return set(), move_type
             link = [l for l in pair if l is not None][0]
@@ -126,12 +164,7 @@ def at_end_pairs(move_type: MoveType):
                 for new_link
                 in new_links
             }
-            new_polymers = {
-                self.substitute_pair(p, new_pair)
-                for new_pair
-                in new_pairs
-            }
-            return new_polymers, move_type
+            return new_pairs, move_type
         return wrapper
     return decorator
 
@@ -141,16 +174,6 @@ class Polymer:
 
     def __init__(self, links):
         self.__links = tuple(map(Link, links))
-        self.__polymer_transformers = (
-            self.__contract_taut_ends_if_possible,
-            self.__extract_slack_ends_if_possible,
-            self.__wiggle_end_links_if_possible,
-            self.__create_hernias_if_possible,
-            self.__repate_if_possible,
-            self.__annihilate_hernias_if_possible,
-            self.__change_hernia_bend_direction_if_possible,
-            self.__flip_bent_pair_if_possible,
-        )
 
     def __repr__(self):
         return 'Polymer([{}])'.format(', '.join(map(repr, self.links())))
@@ -188,18 +211,49 @@ class Polymer:
 
         Creates a set of all valid Polymers with n links.
         """
-        curled_up = Polymer.all_curled_up(n)
-
-        old, new = set(), {curled_up}
-        grow_by = curled_up.reachable_from()
+        return set(cls.explore([Polymer.all_curled_up(n)], {}))
 
-        while new != old:
-            old, new = new, new | grow_by
-            grow_by = functools.reduce(
-                operator.or_,
-                (polymer.reachable_from() for polymer in grow_by))
+    @classmethod
+    def explore(cls, start, move_rates, sum_with=operator.add, zero=0,
+                accept=None):
+        """Polymer.explore(start, move_rates[, sum_with[, zero[, accept]]])
+            -> dict with polymer keys
+
+        Finds all the polymers reachable from the ones in `start`, expanding
+        each of them exactly once. Returns a dictionary mapping them to the
+        result of their `transition_rates` with the remaining arguments. The
+        transition structures are computed directly, bypassing
+        `TRANSITION_CACHE`.
+
+        When `accept` is given, transitions into polymers for which it returns
+        False are dropped, so only the subset of states it accepts is explored
+        beyond `start`.
+        """
+        rates = {}
+        frontier = list(start)
+        seen = set(frontier)
+        while frontier:
+            new_frontier = []
+            for polymer in frontier:
+                # Every polymer is expanded once, so caching its structure
+                # would only hold on to memory.
+                polymer_rates = _summed_rates(
+                    _transition_structure(polymer), move_rates, sum_with, zero)
+                if accept is not None:
+                    polymer_rates = {
+                        target: rate
+                        for target, rate in polymer_rates.items()
+                        if accept(target)
+                    }
+                rates[polymer] = polymer_rates
+
+                for target in polymer_rates:
+                    if target not in seen:
+                        seen.add(target)
+                        new_frontier.append(target)
+            frontier = new_frontier
 
-        return new
+        return rates
 
     @classmethod
     def all_curled_up(cls, link_count):
@@ -212,11 +266,63 @@ class Polymer:
         return cls([Link.SLACK] * link_count)
 
     @classmethod
-    def transition_matrix(cls, link_count, move_rates, sum_with=operator.add, zero=0):
-        all_states = Polymer.all_with_n_links(link_count)
-        rates = dict(
-            (state, state.transition_rates(move_rates, sum_with, zero))
-            for state in all_states)
+    def from_code(cls, code, link_count):
+        """Polymer.from_code(code, link_count) -> a Polymer
+
+        Creates the Polymer with link_count links packed into code. See
+        `polymer_states.codec` for the encoding.
+        """
+        from polymer_states import codec
+        return cls(codec.decode(code, link_count))
+
+    def code(self):
+        """P.code() -> int
+
+        Returns the packed integer code of the polymer. See
+        `polymer_states.codec` for the encoding.
+        """
+        from polymer_states import codec
+        return codec.encode(self.links())
+
+    @classmethod
+    def transition_matrix(cls, link_count, move_rates, sum_with=operator.add,
+                          zero=0, sparse=None, diagonal=False,
+                          by_move_type=False):
+        """Polymer.transition_matrix(link_count, move_rates[, sum_with[, zero]])
+            -> a TransitionMatrix
+
+        Builds the matrix of transition rates between all states with
+        link_count links. See `Polymer.transition_rates` for the meaning of the
+        remaining arguments.
+
+        When `sparse` names a `scipy.sparse` format ('csr' or 'coo') a pair of
+        a sparse matrix and an array of the codes of the states indexing it is
+        returned instead. Its rates are always summed using addition and
+        `diagonal` makes it a generator matrix. See `polymer_states.sparse`.
+
+        With `by_move_type` set, `sparse` defaults to 'csr', `move_rates` is
+        ignored and the pair holds a dictionary mapping every `MoveType` to a
+        sparse matrix counting the moves of that type instead. Rate matrices
+        for any `move_rates` can be summed up from those cheaply with
+        `polymer_states.sparse.combine`.
+        """
+        if by_move_type:
+            if diagonal:
+                raise ValueError("move type matrices have no diagonal")
+            if sparse is None:
+                sparse = 'csr'
+        if diagonal and sparse is None:
+            raise ValueError("diagonal needs a sparse format")
+
+        if sparse is not None:
+            from polymer_states import sparse as sparse_backend
+            if by_move_type:
+                return sparse_backend.move_type_matrices(link_count, sparse)
+            return sparse_backend.transition_matrix(
+                link_count, move_rates, sparse, diagonal)
+
+        rates = Polymer.explore(
+            [Polymer.all_curled_up(link_count)], move_rates, sum_with, zero)
         return TransitionMatrix(rates, zero)
 
     def reachable_from(self) -> set:
@@ -225,7 +331,22 @@ class Polymer:
         Returns the set of polymers that this one can transform into in a single
         step.
         """
-        return set(self.transition_rates({}).keys())
+        return {target for target, _ in self.transition_structure()}
+
+    def transition_structure(self, cache=None) -> tuple:
+        """P.transition_structure([cache]) -> tuple of pairs
+
+        Returns the rate independent structure of the transitions out of the
+        polymer: a `(target, move_counts)` pair for every polymer reachable in
+        a single step, `move_counts` being a tuple of `(move_type, count)`
+        pairs telling how many distinct moves of each type lead to it.
+
+        The result is looked up in `cache`, a `TransitionCache`, defaulting to
+        `TRANSITION_CACHE`.
+        """
+        if cache is None:
+            cache = TRANSITION_CACHE
+        return cache.structure(self)
 
     def transition_rates(self, move_rates: dict, sum_with=operator.add, zero=0) -> dict:
         """P.transition_rates(move_rates[, sum_with]) -> dict with polymer keys
@@ -241,48 +362,8 @@ class Polymer:
         transition rate for moves that don't have one specified in `move_rates`.
         """
 
-        rates = {}
-        for p, pair in enumerate(self.link_pairs()):
-            for t in self.__polymer_transformers:
-                new_polymers, move_type = t(p, pair)
-                rate_diff = move_rates.get(move_type, zero)
-
-                for new_polymer in new_polymers:
-                    old_rate = rates.get(new_polymer, zero)
-                    new_rate = sum_with(old_rate, rate_diff)
-                    rates[new_polymer] = new_rate
-
-        return rates
-
-    def __repate_if_possible(self, p, pair):
-        alternatives = set()
-        if Polymer.can_reptate(pair):
-            alternatives = self.__reptate_at(p, pair)
-        return alternatives, MoveType.REPTATION
-
-    def __create_hernias_if_possible(self, p, pair):
-        alternatives = set()
-        if Polymer.both_slacks(pair):
-            alternatives = self.__create_hernias_at(p, pair)
-        return alternatives, MoveType.HERNIA_CREATION
-
-    def __annihilate_hernias_if_possible(self, p, pair):
-        alternatives = set()
-        if Polymer.is_hernia(pair):
-            alternatives = {self.__annihilate_hernia_at(p)}
-        return alternatives, MoveType.HERNIA_ANNIHILATION
-
-    def __change_hernia_bend_direction_if_possible(self, p, pair):
-        alternatives = set()
-        if Polymer.is_hernia(pair):
-            alternatives = self.__change_hernia_bend_direction(p, pair)
-        return alternatives, MoveType.HERNIA_REDIRECTION
-
-    def __flip_bent_pair_if_possible(self, p, pair):
-        alternatives = set()
-        if Polymer.is_bent_pair(pair):
-            alternatives = {self.__flip_at(p, pair)}
-        return alternatives, MoveType.BARRIER_CROSSING
+        return _summed_rates(
+            self.transition_structure(), move_rates, sum_with, zero)
 
     def contains_hernia(self):
         """P.contains_hernia() -> a bool
@@ -318,52 +399,6 @@ class Polymer:
         ]
         return Polymer(new_vlinks[1:-1])
 
-    def __create_hernias_at(self, i, current):
-        return {
-            self.substitute_pair(i, pair)
-            for pair in {
-                (Link.UP, Link.DOWN),
-                (Link.DOWN, Link.UP),
-                (Link.LEFT, Link.RIGHT),
-                (Link.RIGHT, Link.LEFT)
-            } if pair != current
-        }
-
-    def __annihilate_hernia_at(self, i):
-        return self.substitute_pair(i, (Link.SLACK, Link.SLACK))
-
-    def __reptate_at(self, i, pair):
-        first, second = pair
-        return {
-            self.substitute_pair(i, (second, first))
-        } if first != second else set()
-
-    @at_end_pairs(MoveType.END_CONTRACTION)
-    def __contract_taut_ends_if_possible(link):
-        return {Link.SLACK} if link.is_taut() else set()
-
-    @at_end_pairs(MoveType.END_EXTENSION)
-    def __extract_slack_ends_if_possible(link):
-        return Link.TAUT_LINKS if link.is_slack() else set()
-
-    @at_end_pairs(MoveType.END_WIGGLE)
-    def __wiggle_end_links_if_possible(link):
-        return {
-            taut_link for taut_link in Link.TAUT_LINKS
-            if taut_link != link
-        } if link.is_taut() else set()
-
-    def __flip_at(self, i, current):
-        first, second = current
-        return self.substitute_pair(i, (second, first))
-
-    def __change_hernia_bend_direction(self, i, current):
-        return {
-            self.substitute_pair(i, hernia)
-            for hernia in HERNIA_PAIRS
-            if hernia != current
-        }
-
     # TODO: What happens when the Polymer has no links?
     def link_pairs(self):
         """P.link_pairs() -> iterable of 2-element Link tuples
@@ -420,6 +455,209 @@ HERNIAS = {
 }
 
 
+# Link pair transformers: functions taking a pair of consecutive links (as
+# produced by `Polymer.link_pairs`) to the set of pairs it can be replaced with
+# and the type of the move replacing it.
+
+def _reptate_if_possible(pair):
+    alternatives = set()
+    if Polymer.can_reptate(pair):
+        first, second = pair
+        if first != second:
+            alternatives = {(second, first)}
+    return alternatives, MoveType.REPTATION
+
+
+def _create_hernias_if_possible(pair):
+    alternatives = set()
+    if Polymer.both_slacks(pair):
+        alternatives = set(HERNIA_PAIRS)
+    return alternatives, MoveType.HERNIA_CREATION
+
+
+def _annihilate_hernias_if_possible(pair):
+    alternatives = set()
+    if Polymer.is_hernia(pair):
+        alternatives = {(Link.SLACK, Link.SLACK)}
+    return alternatives, MoveType.HERNIA_ANNIHILATION
+
+
+def _change_hernia_bend_direction_if_possible(pair):
+    alternatives = set()
+    if Polymer.is_hernia(pair):
+        alternatives = HERNIA_PAIRS - {pair}
+    return alternatives, MoveType.HERNIA_REDIRECTION
+
+
+def _flip_bent_pair_if_possible(pair):
+    alternatives = set()
+    if Polymer.is_bent_pair(pair):
+        first, second = pair
+        alternatives = {(second, first)}
+    return alternatives, MoveType.BARRIER_CROSSING
+
+
+@at_end_pairs(MoveType.END_CONTRACTION)
+def _contract_taut_ends_if_possible(link):
+    return {Link.SLACK} if link.is_taut() else set()
+
+
+@at_end_pairs(MoveType.END_EXTENSION)
+def _extract_slack_ends_if_possible(link):
+    return Link.TAUT_LINKS if link.is_slack() else set()
+
+
+@at_end_pairs(MoveType.END_WIGGLE)
+def _wiggle_end_links_if_possible(link):
+    return {
+        taut_link for taut_link in Link.TAUT_LINKS
+        if taut_link != link
+    } if link.is_taut() else set()
+
+
+PAIR_TRANSFORMERS = (
+    _contract_taut_ends_if_possible,
+    _extract_slack_ends_if_possible,
+    _wiggle_end_links_if_possible,
+    _create_hernias_if_possible,
+    _reptate_if_possible,
+    _annihilate_hernias_if_possible,
+    _change_hernia_bend_direction_if_possible,
+    _flip_bent_pair_if_possible,
+)
+
+
+def _pair_sort_key(pair):
+    return tuple(0 if link is None else link for link in pair)
+
+
+def _pair_transitions(pair):
+    transitions = []
+    for transformer in PAIR_TRANSFORMERS:
+        new_pairs, move_type = transformer(pair)
+        transitions.extend(
+            (new_pair, move_type)
+            for new_pair in sorted(new_pairs, key=_pair_sort_key))
+    return tuple(transitions)
+
+
+def pair_displacement(pair, new_pair):
+    """pair_displacement(pair, new_pair) -> (x, y)
+
+    Returns the lattice vector by which replacing pair with new_pair shifts
+    the repton between the pair's links. See `Link.vector`.
+    """
+    # The repton is the end of the left link and the start of the right one,
+    # so moving it changes the left link by its shift and the right one by the
+    # opposite.
+    (left, right), (new_left, new_right) = pair, new_pair
+    if left is not None:
+        (x, y), (new_x, new_y) = left.vector(), new_left.vector()
+        return new_x - x, new_y - y
+    (x, y), (new_x, new_y) = right.vector(), new_right.vector()
+    return x - new_x, y - new_y
+
+
+LINK_PAIRS = frozenset(
+    (first, second)
+    for first in Link.LINKS | {None}
+    for second in Link.LINKS | {None}
+    if (first, second) != (None, None))
+
+# Maps every pair of consecutive links, including the end pairs, to the
+# (replacement pair, MoveType) tuples of all moves possible for it.
+PAIR_TRANSITIONS = {pair: _pair_transitions(pair) for pair in LINK_PAIRS}
+
+
+def _transition_structure(polymer):
+    move_counts = collections.OrderedDict()
+    for p, pair in enumerate(polymer.link_pairs()):
+        for new_pair, move_type in PAIR_TRANSITIONS[pair]:
+            target = polymer.substitute_pair(p, new_pair)
+            counts = move_counts.setdefault(target, collections.Counter())
+            counts[move_type] += 1
+
+    return tuple(
+        (target, tuple(sorted(counts.items())))
+        for target, counts in move_counts.items())
+
+
+def _summed_rates(structure, move_rates, sum_with, zero):
+    rates = {}
+    for target, move_counts in structure:
+        rate = zero
+        for move_type, count in move_counts:
+            rate_diff = move_rates.get(move_type, zero)
+            for _ in range(count):
+                rate = sum_with(rate, rate_diff)
+        rates[target] = rate
+    return rates
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class TransitionCache:
+    """A bounded cache of the transition structure of polymers.
+
+    Holds the result of `Polymer.transition_structure` for up to `maxsize`
+    polymers, evicting the least recently used ones first. A `maxsize` of None
+    makes it unbounded. Hits return the cached structure itself, so looking
+    up the rates of a polymer again with other `move_rates` costs no more
+    than summing them.
+    """
+
+    def __init__(self, maxsize=1 << 10):
+        self.__maxsize = maxsize
+        self.__structures = collections.OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    def structure(self, polymer):
+        """C.structure(polymer) -> tuple of pairs
+
+        Returns the transition structure of polymer, computing it only if it
+        isn't cached yet.
+        """
+        key = polymer.links()
+        structure = self.__structures.get(key)
+        if structure is not None:
+            self.__hits += 1
+            self.__structures.move_to_end(key)
+            return structure
+
+        self.__misses += 1
+        structure = _transition_structure(polymer)
+        if self.__maxsize != 0:
+            self.__structures[key] = structure
+            if self.__maxsize is not None \
+                    and len(self.__structures) > self.__maxsize:
+                self.__structures.popitem(last=False)
+        return structure
+
+    def info(self):
+        """C.info() -> a CacheInfo
+
+        Returns the hit and miss counts along with the size of the cache.
+        """
+        return CacheInfo(self.__hits, self.__misses, self.__maxsize,
+                         len(self.__structures))
+
+    def clear(self):
+        """C.clear()
+
+        Empties the cache and resets its statistics.
+        """
+        self.__structures.clear()
+        self.__hits = self.__misses = 0
+
+
+# The cache used by `Polymer.transition_structure` and the methods based on
+# it. It's kept small: bulk work such as `Polymer.explore` bypasses it.
+TRANSITION_CACHE = TransitionCache()
+
+
 class TransitionMatrix:
     """A matrix of transition rates between polymer states."""
 
@@ -0,0 +1,184 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Packed integer codes for polymer states.
+
+A chain of n links is stored as an n digit, base 5 number. Each link is one
+digit and the chain's head is the most significant one. Digits follow the
+order of `Link` values, so sorting codes sorts the states the same way
+sorting `Polymer`s does.
+"""
+
+__all__ = [
+    'LINK_BASE', 'LINKS_BY_DIGIT', 'DIGITS_BY_LINK', 'MAX_LINK_COUNT',
+    'code_dtype', 'state_count', 'encode', 'decode', 'encode_digits',
+    'decode_digits', 'encode_polymers', 'decode_polymers', 'LETTERS_BY_LINK',
+    'encode_text', 'decode_text',
+]
+
+
+import numpy
+
+from polymer_states import Link, Polymer
+
+
+LINK_BASE = len(Link.LINKS)
+
+LINKS_BY_DIGIT = tuple(sorted(Link.LINKS))
+DIGITS_BY_LINK = {link: digit for digit, link in enumerate(LINKS_BY_DIGIT)}
+
+# 5 ** 27 is the largest power of 5 that still fits into a signed 64 bit
+# integer, which we use for intermediate code arithmetic.
+MAX_LINK_COUNT = 27
+_MAX_UINT32_LINK_COUNT = 13
+
+
+def _check_link_count(link_count):
+    if not 0 <= link_count <= MAX_LINK_COUNT:
+        raise ValueError(
+            "link count must be between 0 and {}, got {}"
+            .format(MAX_LINK_COUNT, link_count))
+
+
+def code_dtype(link_count):
+    """code_dtype(link_count) -> numpy dtype
+
+    Returns the narrowest unsigned integer type that can hold codes of chains
+    with link_count links.
+    """
+    _check_link_count(link_count)
+    if link_count <= _MAX_UINT32_LINK_COUNT:
+        return numpy.dtype(numpy.uint32)
+    return numpy.dtype(numpy.uint64)
+
+
+def state_count(link_count):
+    """state_count(link_count) -> int
+
+    Returns the number of distinct states of a chain with link_count links.
+    """
+    _check_link_count(link_count)
+    return LINK_BASE ** link_count
+
+
+def _digit_weights(link_count):
+    return LINK_BASE ** numpy.arange(link_count - 1, -1, -1, dtype=numpy.int64)
+
+
+def encode(links):
+    """encode(links) -> int
+
+    Packs a sequence of Links into a single integer.
+    """
+    code = 0
+    for link in links:
+        code = code * LINK_BASE + DIGITS_BY_LINK[link]
+    return code
+
+
+def decode(code, link_count):
+    """decode(code, link_count) -> tuple of Links
+
+    Inverse of `encode` for chains with link_count links.
+    """
+    if not 0 <= code < state_count(link_count):
+        raise ValueError(
+            "invalid code {} for {} links".format(code, link_count))
+    links = []
+    for _ in range(link_count):
+        code, digit = divmod(code, LINK_BASE)
+        links.append(LINKS_BY_DIGIT[digit])
+    return tuple(reversed(links))
+
+
+def encode_digits(digits):
+    """encode_digits(digits) -> array of codes
+
+    Packs a 2D array of link digits, one chain per row, into an array of
+    codes.
+    """
+    digits = numpy.asarray(digits)
+    link_count = digits.shape[-1]
+    codes = digits.astype(numpy.int64).dot(_digit_weights(link_count))
+    return codes.astype(code_dtype(link_count))
+
+
+def decode_digits(codes, link_count):
+    """decode_digits(codes, link_count) -> 2D uint8 array
+
+    Unpacks an array of codes into link digits, one chain per row.
+    """
+    codes = numpy.asarray(codes, dtype=numpy.int64)
+    weights = _digit_weights(link_count)
+    digits = (codes[..., numpy.newaxis] // weights) % LINK_BASE
+    return digits.astype(numpy.uint8)
+
+
+def encode_polymers(polymers):
+    """encode_polymers(polymers) -> array of codes
+
+    Packs an iterable of Polymers sharing a link count into an array of codes.
+    """
+    polymers = list(polymers)
+    link_count = len(polymers[0].links()) if polymers else 0
+    codes = numpy.fromiter(
+        (encode(polymer.links()) for polymer in polymers),
+        dtype=numpy.int64, count=len(polymers))
+    return codes.astype(code_dtype(link_count))
+
+
+def decode_polymers(codes, link_count):
+    """decode_polymers(codes, link_count) -> list of Polymers
+
+    Builds a Polymer for every code in an array.
+    """
+    return [
+        Polymer(LINKS_BY_DIGIT[digit] for digit in row)
+        for row in decode_digits(codes, link_count).reshape(-1, link_count)
+    ]
+
+
+# One letter names of links, for compact text output of states.
+LETTERS_BY_LINK = {
+    Link.UP: 'U', Link.DOWN: 'D', Link.LEFT: 'L', Link.RIGHT: 'R',
+    Link.SLACK: 'S',
+}
+_LETTERS = numpy.frombuffer(
+    ''.join(LETTERS_BY_LINK[link] for link in LINKS_BY_DIGIT).encode('ascii'),
+    dtype=numpy.uint8)
+
+
+def encode_text(strings):
+    """encode_text(strings) -> array of codes
+
+    Packs chains written as strings of link letters (see `LETTERS_BY_LINK`),
+    all of the same length, into an array of codes.
+    """
+    digits_by_letter = {
+        letter: DIGITS_BY_LINK[link]
+        for link, letter in LETTERS_BY_LINK.items()
+    }
+    try:
+        digits = [[digits_by_letter[letter] for letter in string]
+                  for string in strings]
+    except KeyError as error:
+        raise ValueError("unknown link letter {}".format(error)) from None
+    if len({len(row) for row in digits}) > 1:
+        raise ValueError("all chains must have the same number of links")
+    link_count = len(digits[0]) if digits else 0
+    return encode_digits(
+        numpy.array(digits, dtype=numpy.uint8).reshape(-1, link_count))
+
+
+def decode_text(codes, link_count):
+    """decode_text(codes, link_count) -> list of str
+
+    Writes out the chains with the given codes as strings of link letters.
+    """
+    codes = numpy.asarray(codes).reshape(-1)
+    if link_count == 0:
+        return [''] * len(codes)
+    letters = _LETTERS[decode_digits(codes, link_count)]
+    return [row.decode('ascii') for row in
+            letters.view('S{}'.format(link_count)).ravel()]
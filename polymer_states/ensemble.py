@@ -0,0 +1,173 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Vectorized simulation of ensembles of independent chains.
+
+Many chains are advanced in lockstep, every step making one continuous time
+(Gillespie) move in each of them. The chains are kept as rows of a 2D array
+of link digits (see `polymer_states.codec`), padded with `kernel.NO_LINK` at
+both ends so that column p and p + 1 always form the p-th link pair. Moves
+are picked and applied for all chains at once using `kernel.PAIR_TABLE`, so
+the move set is the one of `Polymer`.
+
+Observables are accumulated as running sums per chain, so memory use doesn't
+grow with the length of a run.
+"""
+
+__all__ = ['EnsembleStats', 'Ensemble']
+
+
+import collections
+import time
+
+import numpy
+
+from polymer_states import Polymer
+from polymer_states import codec, kernel
+from polymer_states.kmc import RunStats
+
+
+EnsembleStats = collections.namedtuple(
+    'EnsembleStats',
+    ['time', 'drift', 'drift_error', 'diffusion', 'end_to_end_squared'])
+EnsembleStats.__doc__ = """The result of `Ensemble.stats`.
+
+`time` is the mean simulated time of the chains, `drift` the mean velocity
+of their centers of mass along the field and `drift_error` its standard
+error. `diffusion` is the center of mass diffusion coefficient along the field
+and `end_to_end_squared` the time averaged squared end-to-end distance.
+"""
+
+
+_LINK_VECTORS = numpy.array(
+    [link.vector() for link in codec.LINKS_BY_DIGIT] + [(0, 0)],
+    dtype=numpy.int64)
+
+
+def _entry_rates(move_rates, bias):
+    table = kernel.PAIR_TABLE
+    width = table.move_types.shape[1]
+    rates = kernel.rate_lookup(move_rates)[table.move_types]
+    rates *= bias ** (table.displacements[..., 0] / 2)
+    rates[numpy.arange(width) >= table.counts[:, numpy.newaxis]] = 0
+    return rates
+
+
+class Ensemble:
+    """An ensemble of independent chains simulated in lockstep.
+
+    Moves happen with the rates in `move_rates`, multiplied by
+    `bias ** (dx / 2)` for moves shifting a repton by dx along the field. All
+    chains start as `initial`, which defaults to a curled up chain.
+    """
+
+    def __init__(self, chain_count, link_count, move_rates, bias=1.0,
+                 seed=None, initial=None):
+        if initial is None:
+            initial = Polymer.all_curled_up(link_count)
+        digits = [codec.DIGITS_BY_LINK[link] for link in initial.links()]
+
+        self.__link_count = link_count
+        self.__padded = numpy.tile(
+            numpy.array([kernel.NO_LINK] + digits + [kernel.NO_LINK],
+                        dtype=numpy.int64),
+            (chain_count, 1))
+        self.__rows = numpy.arange(chain_count)
+        self.__random = numpy.random.RandomState(seed)
+        self.__entry_rates = _entry_rates(move_rates, bias)
+        self.__pair_rates = self.__entry_rates.sum(axis=1)
+
+        self.__steps = 0
+        self.__time = numpy.zeros(chain_count)
+        self.__shift = numpy.zeros((chain_count, 2), dtype=numpy.int64)
+        self.__end_to_end_squared = numpy.zeros(chain_count)
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def steps(self):
+        """E.steps() -> int"""
+        return self.__steps
+
+    def digits(self):
+        """E.digits() -> 2D array
+
+        Returns the link digits of the chains, one chain per row.
+        """
+        return self.__padded[:, 1:-1].astype(numpy.uint8)
+
+    def polymers(self):
+        """E.polymers() -> list of Polymers"""
+        return codec.decode_polymers(
+            codec.encode_digits(self.digits()), self.__link_count)
+
+    def end_to_end(self):
+        """E.end_to_end() -> 2D array
+
+        Returns the end-to-end vectors of the chains, one chain per row.
+        """
+        return _LINK_VECTORS[self.__padded].sum(axis=1)
+
+    def step(self):
+        """E.step()
+
+        Makes a single move in every chain.
+        """
+        padded, rows, rand = self.__padded, self.__rows, self.__random
+        ids = kernel.pair_ids(padded[:, :-1], padded[:, 1:])
+
+        cumulative = numpy.cumsum(self.__pair_rates[ids], axis=1)
+        totals = cumulative[:, -1]
+        waited = rand.exponential(1.0, len(rows)) / totals
+
+        value = rand.random_sample(len(rows)) * totals
+        p = numpy.minimum(
+            (cumulative <= value[:, numpy.newaxis]).sum(axis=1),
+            self.__link_count)
+        chosen = ids[rows, p]
+
+        entry_cumulative = numpy.cumsum(self.__entry_rates[chosen], axis=1)
+        value = rand.random_sample(len(rows)) * entry_cumulative[:, -1]
+        k = numpy.minimum(
+            (entry_cumulative <= value[:, numpy.newaxis]).sum(axis=1),
+            kernel.PAIR_TABLE.counts[chosen] - 1)
+
+        self.__end_to_end_squared += waited * (self.end_to_end() ** 2).sum(1)
+        padded[rows, p] = kernel.PAIR_TABLE.new_left[chosen, k]
+        padded[rows, p + 1] = kernel.PAIR_TABLE.new_right[chosen, k]
+        self.__shift += kernel.PAIR_TABLE.displacements[chosen, k]
+        self.__time += waited
+        self.__steps += 1
+
+    def run(self, steps):
+        """E.run(steps) -> a RunStats
+
+        Makes the given number of steps and reports how fast that went. The
+        simulated time is averaged over the chains, while steps_per_second
+        counts the moves made in all of them.
+        """
+        start_time, start = self.__time.mean(), time.perf_counter()
+        for _ in range(steps):
+            self.step()
+        elapsed = time.perf_counter() - start
+        moves = steps * len(self)
+        return RunStats(
+            steps, self.__time.mean() - start_time, elapsed,
+            moves / elapsed if elapsed > 0 else float('inf'))
+
+    def stats(self):
+        """E.stats() -> an EnsembleStats
+
+        Summarizes the observables accumulated since the start.
+        """
+        times = self.__time
+        shifts = self.__shift[:, 0] / (self.__link_count + 1)
+        velocities = shifts / times
+        drift = velocities.mean()
+        drift_error = (velocities.std(ddof=1) / numpy.sqrt(len(self))
+                       if len(self) > 1 else float('nan'))
+        diffusion = ((shifts - drift * times) ** 2).mean() / (2 * times.mean())
+        return EnsembleStats(
+            times.mean(), drift, drift_error, diffusion,
+            self.__end_to_end_squared.sum() / times.sum())
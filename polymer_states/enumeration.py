@@ -0,0 +1,143 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Direct enumeration of polymer states in canonical order.
+
+Every sequence of links is a valid state, so the states of an n-link chain
+are exactly the codes 0, 1, ..., 5 ** n - 1 (see `polymer_states.codec`).
+The canonical order is the order of those codes, which is also the order in
+which `Polymer`s sort. A state's rank in that order is its code.
+"""
+
+__all__ = ['OUTPUT_FORMATS', 'state_range', 'all_codes', 'rank', 'unrank',
+           'iter_states', 'all_states', 'iter_code_chunks', 'write_states']
+
+
+import numpy
+import numpy.lib.format
+
+from polymer_states import Polymer
+from polymer_states import codec
+
+
+def state_range(link_count, start=0, stop=None):
+    """state_range(link_count[, start[, stop]]) -> (start, stop)
+
+    Checks that the ranks from start up to, but excluding, stop are those of
+    states with link_count links, raising ValueError otherwise. stop defaults
+    to the number of states.
+    """
+    count = codec.state_count(link_count)
+    if stop is None:
+        stop = count
+    if not 0 <= start <= stop <= count:
+        raise ValueError(
+            "invalid state range [{}, {}) for {} links"
+            .format(start, stop, link_count))
+    return start, stop
+
+
+def all_codes(link_count, start=0, stop=None):
+    """all_codes(link_count[, start[, stop]]) -> array of codes
+
+    Returns the codes of the states ranked from start up to, but excluding,
+    stop. By default all states are included.
+    """
+    start, stop = state_range(link_count, start, stop)
+    return numpy.arange(start, stop, dtype=codec.code_dtype(link_count))
+
+
+def rank(polymer):
+    """rank(polymer) -> int
+
+    Returns the position of polymer in the canonical order of states with the
+    same number of links.
+    """
+    return polymer.code()
+
+
+def unrank(i, link_count):
+    """unrank(i, link_count) -> a Polymer
+
+    Returns the i-th state of a chain with link_count links in canonical
+    order.
+    """
+    return Polymer.from_code(i, link_count)
+
+
+def iter_states(link_count, start=0, stop=None):
+    """iter_states(link_count[, start[, stop]]) -> iterator of Polymers
+
+    Lazily yields the states ranked from start up to, but excluding, stop in
+    canonical order.
+    """
+    start, stop = state_range(link_count, start, stop)
+    for i in range(start, stop):
+        yield unrank(i, link_count)
+
+
+def all_states(link_count):
+    """all_states(link_count) -> list of Polymers
+
+    Returns all states of a chain with link_count links in canonical order.
+    """
+    return list(iter_states(link_count))
+
+
+def iter_code_chunks(link_count, start=0, stop=None, chunk_size=1 << 16):
+    """iter_code_chunks(link_count[, start[, stop[, chunk_size]]])
+        -> iterator of code arrays
+
+    Lazily yields the codes of the states ranked from start up to, but
+    excluding, stop in canonical order, chunk_size of them at a time.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    start, stop = state_range(link_count, start, stop)
+    for first in range(start, stop, chunk_size):
+        yield all_codes(link_count, first, min(first + chunk_size, stop))
+
+
+# Ways `write_states` can write states out:
+# * 'repr' writes one `Polymer` repr per line,
+# * 'text' writes one string of link letters (see `codec.LETTERS_BY_LINK`)
+#   per line,
+# * 'codes' writes one code per line,
+# * 'npy' writes a `.npy` array of codes, and needs a binary file.
+OUTPUT_FORMATS = ('repr', 'text', 'codes', 'npy')
+
+
+def write_states(file, link_count, format='repr', start=0, stop=None,
+                 chunk_size=1 << 16):
+    """write_states(file, link_count[, format[, start[, stop[,
+    chunk_size]]]]) -> int
+
+    Streams the states ranked from start up to, but excluding, stop to a file
+    in one of `OUTPUT_FORMATS`, chunk_size states at a time, and returns how
+    many were written.
+    """
+    if format not in OUTPUT_FORMATS:
+        raise ValueError("unknown output format {!r}".format(format))
+    start, stop = state_range(link_count, start, stop)
+
+    if format == 'npy':
+        dtype = codec.code_dtype(link_count).newbyteorder('<')
+        numpy.lib.format.write_array_header_1_0(file, {
+            'descr': numpy.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (stop - start,),
+        })
+
+    for codes in iter_code_chunks(link_count, start, stop, chunk_size):
+        if format == 'npy':
+            file.write(codes.astype(dtype).tobytes())
+            continue
+        if format == 'repr':
+            lines = map(repr, codec.decode_polymers(codes, link_count))
+        elif format == 'text':
+            lines = codec.decode_text(codes, link_count)
+        else:
+            lines = map(str, codes.tolist())
+        file.write(''.join(line + '\n' for line in lines))
+    return stop - start
@@ -0,0 +1,87 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Breadth-first exploration of the state space on encoded states.
+
+This is the array counterpart of `Polymer.explore`: starting from a set of
+codes it expands every state found exactly once, one frontier at a time, and
+keeps the transitions seen on the way. Enumerating the states and building
+their transition matrix is then a single pass.
+"""
+
+__all__ = ['Exploration', 'explore', 'transition_matrix']
+
+
+import collections
+
+import numpy
+
+from polymer_states import codec, kernel, sparse
+
+
+Exploration = collections.namedtuple(
+    'Exploration', ['link_count', 'states', 'sources', 'targets', 'move_types'])
+Exploration.__doc__ = """The result of `explore`.
+
+`states` holds the sorted codes of all states found. `sources`, `targets` and
+`move_types` describe the transitions between them, states being given by
+their index in `states`.
+"""
+
+
+def explore(start, link_count, accept=None):
+    """explore(start, link_count[, accept]) -> an Exploration
+
+    Finds all the states of link_count link chains reachable from the codes in
+    `start`, along with all transitions between them.
+
+    When `accept` is given it is called with arrays of codes and must return
+    boolean masks of the same shape. Transitions into states it rejects are
+    dropped, so only the accepted subset is explored beyond `start`.
+    """
+    dtype = codec.code_dtype(link_count)
+    frontier = numpy.unique(numpy.asarray(start, dtype=dtype))
+    seen = frontier
+
+    found_sources, found_targets, found_move_types = [], [], []
+    while len(frontier):
+        sources, targets, move_types = kernel.transitions(frontier, link_count)
+        if accept is not None:
+            accepted = numpy.asarray(accept(targets), dtype=bool)
+            sources = sources[accepted]
+            targets = targets[accepted]
+            move_types = move_types[accepted]
+
+        found_sources.append(sources)
+        found_targets.append(targets)
+        found_move_types.append(move_types)
+
+        new = numpy.unique(targets)
+        frontier = new[~numpy.isin(new, seen, assume_unique=True)]
+        seen = numpy.union1d(seen, frontier)
+
+    index = sparse.index_dtype(len(seen))
+    sources = numpy.concatenate(found_sources) if found_sources else seen[:0]
+    targets = numpy.concatenate(found_targets) if found_targets else seen[:0]
+    return Exploration(
+        link_count,
+        seen,
+        numpy.searchsorted(seen, sources).astype(index),
+        numpy.searchsorted(seen, targets).astype(index),
+        (numpy.concatenate(found_move_types) if found_move_types
+         else numpy.empty(0, numpy.uint8)))
+
+
+def transition_matrix(exploration, move_rates, format='csr', diagonal=False):
+    """transition_matrix(exploration, move_rates[, format[, diagonal]])
+        -> sparse matrix
+
+    Builds the sparse transition matrix between the states of an Exploration,
+    indexed like its `states`. See `polymer_states.sparse.from_transitions`
+    for the meaning of format and diagonal.
+    """
+    rates = kernel.rate_lookup(move_rates)[exploration.move_types]
+    return sparse.from_transitions(
+        exploration.sources, exploration.targets, rates,
+        len(exploration.states), format, diagonal)
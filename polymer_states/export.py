@@ -0,0 +1,298 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Exporting transition matrices for external solvers.
+
+Two formats are written, both in bulk, a chunk of entries at a time:
+
+* Matrix Market coordinate files, readable by most solvers and by
+  `scipy.io.mmread`, along with a text file of state labels (see
+  `codec.decode_text`),
+* a chunked binary container holding named arrays. The file starts with
+  `MAGIC`, followed by the arrays' chunks, each aligned to `ALIGNMENT` bytes,
+  and a JSON index of where every chunk lies. It ends with the index's length
+  as a little endian 64 bit integer and `MAGIC` again, so the index is found
+  by reading the file's tail. Arrays stored in a single chunk are memory
+  mapped when loaded.
+
+The container stores a CSR rate matrix, the state codes and, optionally, the
+per move type count matrices of `sparse.move_type_matrices`, so `load`
+rebuilds them without enumerating any states.
+"""
+
+__all__ = ['MAGIC', 'FORMAT_VERSION', 'ALIGNMENT', 'Exported',
+           'ContainerWriter', 'read_index', 'load_array', 'save', 'load',
+           'write_matrix_market', 'export_matrix_market']
+
+
+import collections
+import json
+import os
+import struct
+
+import numpy
+import numpy.lib.format
+import scipy.sparse
+
+from polymer_states import MoveType
+from polymer_states import codec
+
+
+MAGIC = b'PSTATES\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_CSR_PARTS = ('data', 'indices', 'indptr')
+_TRAILER = struct.Struct('<Q')
+
+
+class ContainerWriter:
+    """Writes named arrays, chunk by chunk, into a container file.
+
+    Use as a context manager, or call close() to write the index. Leaving the
+    context with an exception deletes the file instead, so no partly written
+    container is ever left behind looking complete.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.__path = path
+        self.__file = open(path, 'wb')
+        self.__file.write(MAGIC)
+        self.__arrays = collections.OrderedDict()
+        self.metadata = dict(metadata or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif not self.__file.closed:
+            self.__file.close()
+            os.remove(self.__path)
+
+    def write_chunk(self, name, chunk):
+        """C.write_chunk(name, chunk)
+
+        Appends a chunk to the named 1D array, creating it if needed. All
+        chunks of an array must share a dtype.
+        """
+        chunk = numpy.ascontiguousarray(chunk).reshape(-1)
+        dtype = numpy.lib.format.dtype_to_descr(chunk.dtype)
+        array = self.__arrays.setdefault(
+            name, {'dtype': dtype, 'length': 0, 'chunks': []})
+        if array['dtype'] != dtype:
+            raise ValueError(
+                "chunk of {!r} has dtype {}, not {}"
+                .format(name, dtype, array['dtype']))
+
+        file = self.__file
+        file.write(b'\0' * (-file.tell() % ALIGNMENT))
+        array['chunks'].append([file.tell(), len(chunk)])
+        array['length'] += len(chunk)
+        file.write(chunk.tobytes())
+
+    def write_array(self, name, array, chunk_size=1 << 20):
+        """C.write_array(name, array[, chunk_size])
+
+        Writes a whole 1D array, chunk_size items at a time.
+        """
+        array = numpy.asarray(array).reshape(-1)
+        if not len(array):
+            self.write_chunk(name, array)
+        for start in range(0, len(array), chunk_size):
+            self.write_chunk(name, array[start:start + chunk_size])
+
+    def close(self):
+        """C.close()
+
+        Writes the index and closes the file.
+        """
+        if self.__file.closed:
+            return
+        index = json.dumps({
+            'version': FORMAT_VERSION,
+            'metadata': self.metadata,
+            'arrays': self.__arrays,
+        }).encode('utf-8')
+        self.__file.write(index)
+        self.__file.write(_TRAILER.pack(len(index)))
+        self.__file.write(MAGIC)
+        self.__file.close()
+
+
+def read_index(path):
+    """read_index(path) -> dict
+
+    Reads the index of a container file: its 'metadata' and, for every array
+    in 'arrays', its 'dtype', 'length' and the (offset, length) of its
+    'chunks'.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < 2 * len(MAGIC) + _TRAILER.size:
+            raise ValueError("{!r} isn't a container file".format(path))
+        head = file.read(len(MAGIC))
+        file.seek(-(_TRAILER.size + len(MAGIC)), os.SEEK_END)
+        size, = _TRAILER.unpack(file.read(_TRAILER.size))
+        tail = file.read(len(MAGIC))
+        if head != MAGIC or tail != MAGIC:
+            raise ValueError("{!r} isn't a container file".format(path))
+        file.seek(-(size + _TRAILER.size + len(MAGIC)), os.SEEK_END)
+        index = json.loads(file.read(size).decode('utf-8'))
+    if index['version'] != FORMAT_VERSION:
+        raise ValueError("unsupported container version {}"
+                         .format(index['version']))
+    return index
+
+
+def load_array(path, name, index=None, mmap_mode='r'):
+    """load_array(path, name[, index[, mmap_mode]]) -> array
+
+    Loads the named array of a container file, memory mapping it with the
+    given mode if it was stored as a single chunk. Pass the result of
+    `read_index` as index to avoid reading it again.
+    """
+    if index is None:
+        index = read_index(path)
+    array = index['arrays'][name]
+    dtype = numpy.dtype(array['dtype'])
+    chunks = array['chunks']
+    if len(chunks) == 1 and chunks[0][1] and mmap_mode is not None:
+        offset, length = chunks[0]
+        return numpy.memmap(path, dtype=dtype, mode=mmap_mode,
+                            offset=offset, shape=(length,))
+
+    loaded = numpy.empty(array['length'], dtype=dtype)
+    position = 0
+    with open(path, 'rb') as file:
+        for offset, length in chunks:
+            file.seek(offset)
+            loaded[position:position + length] = numpy.frombuffer(
+                file.read(length * dtype.itemsize), dtype=dtype)
+            position += length
+    return loaded
+
+
+Exported = collections.namedtuple(
+    'Exported', ['matrix', 'states', 'move_type_matrices', 'link_count'])
+Exported.__doc__ = """The result of `load`.
+
+`move_type_matrices` is None unless they were saved.
+"""
+
+
+def _write_csr(writer, prefix, matrix, chunk_size):
+    matrix = scipy.sparse.csr_matrix(matrix)
+    for part in _CSR_PARTS:
+        writer.write_array(prefix + part, getattr(matrix, part), chunk_size)
+
+
+def _load_csr(path, index, prefix, state_count, mmap_mode):
+    return scipy.sparse.csr_matrix(
+        tuple(load_array(path, prefix + part, index, mmap_mode)
+              for part in _CSR_PARTS),
+        shape=(state_count, state_count), copy=False)
+
+
+def save(path, link_count, matrix, states, move_type_matrices=None,
+         metadata=None, chunk_size=1 << 20):
+    """save(path, link_count, matrix, states[, move_type_matrices[,
+    metadata[, chunk_size]]])
+
+    Writes a transition matrix of link_count link chains, the codes of the
+    states indexing it and optionally the per move type matrices into a
+    container file. metadata is any JSON serializable dictionary to keep
+    alongside, such as the rates used.
+    """
+    metadata = dict(metadata or {}, link_count=link_count)
+    with ContainerWriter(path, metadata) as writer:
+        writer.write_array('states', states, chunk_size)
+        _write_csr(writer, 'matrix/', matrix, chunk_size)
+        for move_type, counts in sorted((move_type_matrices or {}).items()):
+            _write_csr(writer, 'move_types/{}/'.format(int(move_type)),
+                       counts, chunk_size)
+
+
+def load(path, mmap_mode='r'):
+    """load(path[, mmap_mode]) -> an Exported
+
+    Loads what `save` wrote, memory mapping arrays where possible.
+    """
+    index = read_index(path)
+    states = load_array(path, 'states', index, mmap_mode)
+    matrix = _load_csr(path, index, 'matrix/', len(states), mmap_mode)
+
+    move_types = sorted({
+        int(name.split('/')[1]) for name in index['arrays']
+        if name.startswith('move_types/')
+    })
+    matrices = {
+        MoveType(value): _load_csr(
+            path, index, 'move_types/{}/'.format(value), len(states),
+            mmap_mode)
+        for value in move_types
+    } or None
+    return Exported(matrix, states, matrices, index['metadata']['link_count'])
+
+
+def write_matrix_market(file, matrix, comment=None, chunk_size=1 << 16):
+    """write_matrix_market(file, matrix[, comment[, chunk_size]])
+
+    Writes a sparse matrix to a text file as a Matrix Market coordinate
+    matrix, chunk_size rows at a time. Integer matrices are written as
+    integer ones.
+    """
+    matrix = scipy.sparse.csr_matrix(matrix)
+    integer = numpy.issubdtype(matrix.dtype, numpy.integer)
+    file.write('%%MatrixMarket matrix coordinate {} general\n'
+               .format('integer' if integer else 'real'))
+    for line in (comment or '').splitlines():
+        file.write('%{}\n'.format(line))
+    file.write('{} {} {}\n'.format(*matrix.shape, matrix.nnz))
+
+    value_format = '%d' if integer else '%.17g'
+    for start in range(0, matrix.shape[0], chunk_size):
+        chunk = matrix[start:start + chunk_size].tocoo()
+        if chunk.nnz:
+            numpy.savetxt(
+                file,
+                numpy.rec.fromarrays(
+                    (chunk.row + start + 1, chunk.col + 1, chunk.data)),
+                fmt=('%d', '%d', value_format))
+
+
+def export_matrix_market(directory, link_count, matrix, states,
+                         move_type_matrices=None, chunk_size=1 << 16):
+    """export_matrix_market(directory, link_count, matrix, states[,
+    move_type_matrices[, chunk_size]]) -> list of paths
+
+    Writes a transition matrix to `rates.mtx` in directory, the states
+    indexing it as link letter strings to `states.txt`, one per line, and the
+    per move type matrices, if given, to files named after the move types,
+    such as `reptation.mtx`. Returns the paths of the files written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = []
+
+    def export(name, exported, comment):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as file:
+            write_matrix_market(file, exported, comment, chunk_size)
+        written.append(path)
+
+    export('rates.mtx', matrix,
+           'transition rates of {} link chains'.format(link_count))
+    path = os.path.join(directory, 'states.txt')
+    with open(path, 'w') as file:
+        for start in range(0, len(states), chunk_size):
+            labels = codec.decode_text(
+                states[start:start + chunk_size], link_count)
+            file.write(''.join(label + '\n' for label in labels))
+    written.append(path)
+
+    for move_type, counts in sorted((move_type_matrices or {}).items()):
+        name = repr(MoveType(move_type)).split('.')[-1].lower()
+        export(name + '.mtx', counts,
+               'number of {!r} moves'.format(MoveType(move_type)))
+    return written
@@ -0,0 +1,143 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Field driven dynamics and drift velocities.
+
+As in the van Leeuwen and Drzewinski model, a field pointing along the x axis
+multiplies the rate of every move by B ** (dx / 2), where dx is the
+displacement of the moved repton along the field and B the bias. B = 1 means
+no field.
+
+The structure is split by move type and displacement, so rate matrices for
+any bias come out of a cheap weighted sum, just like `sparse.combine` does
+for move types alone.
+"""
+
+__all__ = ['field_matrices', 'combine', 'Drift', 'drift_velocity',
+           'extrapolate']
+
+
+import collections
+
+import numpy
+import scipy.sparse
+
+from polymer_states import MoveType
+from polymer_states import codec, enumeration, kernel, sparse, stationary
+
+
+def field_matrices(link_count, format='csr'):
+    """field_matrices(link_count[, format]) -> (dict, state codes)
+
+    Decomposes the transition structure of link_count link chains by kind of
+    move and displacement along the field. Returns a dictionary mapping
+    `(move_type, dx)` pairs to sparse matrices counting those moves between
+    each pair of states, along with the codes of the states indexing them.
+    """
+    if format not in sparse.FORMATS:
+        raise ValueError("unsupported sparse format {!r}".format(format))
+
+    codes = enumeration.all_codes(link_count)
+    sources, targets, move_types, displacements = kernel.transitions(
+        codes, link_count, displacements=True)
+    dtype = sparse.index_dtype(len(codes))
+    sources, targets = sources.astype(dtype), targets.astype(dtype)
+    shifts = displacements[:, 0]
+
+    matrices = {}
+    for move_type in sorted(MoveType.MOVE_TYPES):
+        of_type = move_types == move_type
+        for dx in numpy.unique(shifts[of_type]).tolist():
+            selected = of_type & (shifts == dx)
+            matrices[move_type, dx] = _count_matrix(
+                sources[selected], targets[selected], len(codes), format)
+    return matrices, codes
+
+
+def _count_matrix(sources, targets, state_count, format):
+    matrix = scipy.sparse.coo_matrix(
+        (numpy.ones(len(sources), dtype=numpy.uint8), (sources, targets)),
+        shape=(state_count, state_count))
+    if format == 'csr':
+        matrix = matrix.tocsr()
+    return matrix
+
+
+def _weights(matrices, move_rates, bias):
+    return {
+        (move_type, dx): move_rates.get(move_type, 0) * bias ** (dx / 2)
+        for move_type, dx in matrices
+    }
+
+
+def combine(matrices, move_rates, bias, diagonal=False):
+    """combine(matrices, move_rates, bias[, diagonal]) -> sparse matrix
+
+    Weights the matrices returned by `field_matrices` with the rates in
+    move_rates and the field factors for the given bias and sums them into a
+    CSR rate matrix. See `polymer_states.sparse.with_diagonal` for the meaning
+    of diagonal.
+    """
+    state_count = next(iter(matrices.values())).shape[0]
+    matrix = scipy.sparse.csr_matrix(
+        (state_count, state_count), dtype=numpy.float64)
+    for key, weight in _weights(matrices, move_rates, bias).items():
+        if weight:
+            matrix = matrix + weight * matrices[key].tocsr()
+    if diagonal:
+        matrix = sparse.with_diagonal(matrix)
+    return matrix
+
+
+Drift = collections.namedtuple('Drift', ['velocity', 'stationary'])
+Drift.__doc__ = """The result of `drift_velocity`.
+
+`velocity` is the mean velocity of the chain's center of mass along the
+field and `stationary` the `StationaryResult` it was averaged over.
+"""
+
+
+def drift_velocity(link_count, move_rates, bias, matrices=None, **options):
+    """drift_velocity(link_count, move_rates, bias[, matrices, ...]) -> a Drift
+
+    Computes the stationary drift velocity along the field of link_count link
+    chains. Every move shifts the center of mass of the link_count + 1 reptons
+    by dx / (link_count + 1).
+
+    Pass the result of `field_matrices` as matrices to reuse it across calls.
+    Remaining keyword arguments go to
+    `polymer_states.stationary.stationary_distribution`.
+    """
+    if matrices is None:
+        matrices, _ = field_matrices(link_count)
+
+    generator = combine(matrices, move_rates, bias, diagonal=True)
+    result = stationary.stationary_distribution(generator, **options)
+
+    shift_rates = numpy.zeros(codec.state_count(link_count))
+    for (move_type, dx), weight in _weights(
+            matrices, move_rates, bias).items():
+        if weight and dx:
+            counts = numpy.asarray(matrices[move_type, dx].sum(axis=1))
+            shift_rates += weight * dx * counts.ravel()
+
+    velocity = float(result.distribution.dot(shift_rates)) / (link_count + 1)
+    return Drift(velocity, result)
+
+
+def extrapolate(link_counts, values, order=2):
+    """extrapolate(link_counts, values[, order]) -> float
+
+    Estimates the limit of values, a quantity measured for the given chain
+    lengths, as the chains grow infinitely long. A polynomial of the given
+    order in 1 / link_count is fitted to the values by least squares and
+    evaluated at zero.
+    """
+    link_counts = numpy.asarray(link_counts, dtype=numpy.float64)
+    if len(link_counts) <= order:
+        raise ValueError(
+            "need more than {} chain lengths for an order {} fit"
+            .format(order, order))
+    coefficients = numpy.polyfit(1 / link_counts, values, order)
+    return float(coefficients[-1])
@@ -2,46 +2,50 @@
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import numpy
-import scipy.misc
 from matplotlib import pyplot
 from argparse import ArgumentParser
-from polymer_states import Polymer, MoveType
+from polymer_states import model_rates
+from polymer_states import render, sparse, store
 
 parser = ArgumentParser()
 parser.add_argument('link_count', metavar='LINK_COUNT', type=int)
 parser.add_argument('h', metavar='H', type=float)
 parser.add_argument('c', metavar='C', type=float)
 parser.add_argument('--out', '-o', metavar='OUT')
+parser.add_argument('--no-cache', action='store_true',
+                    help="don't use the on-disk structure cache")
+parser.add_argument('--size', type=int, default=render.DEFAULT_SIZE,
+                    help="image pixels per side (default: %(default)s)")
+parser.add_argument('--aggregate', choices=render.AGGREGATES, default='max',
+                    help="how to combine the rates drawn into one pixel "
+                         "(default: %(default)s)")
+parser.add_argument('--log', action='store_true',
+                    help="scale pixel brightness logarithmically")
+parser.add_argument('--stream', action='store_true',
+                    help="compute transitions chunk by chunk instead of "
+                         "building the matrix")
 args = parser.parse_args()
 
 
 def generate_image(matrix):
-    state_count = matrix.size()
-    image = numpy.zeros((state_count, state_count), dtype=numpy.float)
-    state_order = list(sorted(matrix.states()))
-    for i, origin in enumerate(state_order):
-        for j, target in enumerate(state_order):
-            image[i, j] = matrix[origin, target]
-
-    image /= image.max()
-    return image
+    image = render.rasterize_matrix(matrix, args.size, args.aggregate)
+    return render.normalize(image, args.log)
 
 if __name__ == '__main__':
-    rates = {
-        MoveType.REPTATION: 1.0,
-        MoveType.HERNIA_CREATION: args.h,
-        MoveType.HERNIA_ANNIHILATION: args.h,
-        MoveType.HERNIA_REDIRECTION: args.h,
-        MoveType.BARRIER_CROSSING: args.c,
-        MoveType.END_EXTENSION: 1.0,
-        MoveType.END_CONTRACTION: args.h,
-        MoveType.END_WIGGLE: args.h,
-    }
-    matrix = Polymer.transition_matrix(args.link_count, rates)
-    image = generate_image(matrix)
+    rates = model_rates(args.h, args.c)
+    if args.stream:
+        image = render.normalize(
+            render.rasterize_transitions(
+                args.link_count, rates, args.size, args.aggregate),
+            args.log)
+    else:
+        if args.no_cache:
+            matrices, _ = sparse.move_type_matrices(args.link_count)
+        else:
+            matrices, _ = store.move_type_matrices(args.link_count)
+        image = generate_image(sparse.combine(matrices, rates))
     if not args.out:
         pyplot.imshow(image, interpolation='nearest', cmap=pyplot.get_cmap('gray'))
         pyplot.show()
     else:
-        scipy.misc.imsave(args.out, image)
+        pyplot.imsave(args.out, image, cmap=pyplot.get_cmap('gray'))
@@ -2,17 +2,45 @@
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import sys
 from argparse import ArgumentParser
-from polymer_states import Polymer
+from polymer_states.enumeration import OUTPUT_FORMATS, state_range
+from polymer_states.enumeration import write_states
 
 
 parser = ArgumentParser()
 parser.add_argument('link_count', metavar='LINK_COUNT', type=int)
+parser.add_argument('--format', '-f', choices=OUTPUT_FORMATS, default='repr',
+                    help="how to write states out (default: %(default)s)")
+parser.add_argument('--start', type=int, default=0,
+                    help="rank of the first state to write")
+parser.add_argument('--stop', type=int,
+                    help="rank one past the last state to write")
+parser.add_argument('--count', action='store_true',
+                    help="only print how many states are in the range")
+parser.add_argument('--out', '-o', metavar='OUT',
+                    help="write to OUT instead of standard output")
 args = parser.parse_args()
 
 
 if __name__ == '__main__':
+    try:
+        start, stop = state_range(args.link_count, args.start, args.stop)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.count:
+        print(stop - start)
+        sys.exit()
 
-    polymers = Polymer.all_with_n_links(args.link_count)
-    for polymer in polymers:
-        print(polymer)
+    binary = args.format == 'npy'
+    if args.out:
+        out = open(args.out, 'wb' if binary else 'w')
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    try:
+        write_states(out, args.link_count, args.format, start, stop)
+    except ValueError as error:
+        parser.error(str(error))
+    finally:
+        if args.out:
+            out.close()
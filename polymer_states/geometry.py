@@ -0,0 +1,122 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Geometric observables of many states at once.
+
+Repton positions are the running sums of the link vectors (see
+`Link.vector`), starting with the head repton at the origin. Everything here
+works on arrays of state codes (see `polymer_states.codec`) and returns one
+value per code, so `all_observables` gives arrays aligned with the state
+index that average over a distribution with a single dot product.
+"""
+
+__all__ = ['LINK_VECTORS', 'OBSERVABLES', 'positions', 'end_to_end',
+           'end_to_end_squared', 'radius_of_gyration_squared',
+           'hernia_count', 'slack_count', 'all_observables']
+
+
+import numpy
+
+from polymer_states import HERNIA_PAIRS, Link
+from polymer_states import codec, enumeration
+
+
+# The (x, y) vectors of the links, indexed by link digit.
+LINK_VECTORS = numpy.array(
+    [link.vector() for link in codec.LINKS_BY_DIGIT], dtype=numpy.int64)
+
+_IS_HERNIA = numpy.zeros((codec.LINK_BASE, codec.LINK_BASE), dtype=bool)
+for _left, _right in HERNIA_PAIRS:
+    _IS_HERNIA[codec.DIGITS_BY_LINK[_left], codec.DIGITS_BY_LINK[_right]] = True
+
+
+def _digits(codes, link_count):
+    return codec.decode_digits(codes, link_count).reshape(-1, link_count)
+
+
+def positions(codes, link_count):
+    """positions(codes, link_count) -> 3D int array
+
+    Returns the (x, y) positions of the link_count + 1 reptons of each state,
+    with shape (states, reptons, 2).
+    """
+    steps = LINK_VECTORS[_digits(codes, link_count)]
+    found = numpy.zeros((len(steps), link_count + 1, 2), dtype=numpy.int64)
+    numpy.cumsum(steps, axis=1, out=found[:, 1:])
+    return found
+
+
+def end_to_end(codes, link_count):
+    """end_to_end(codes, link_count) -> 2D int array
+
+    Returns the vectors from the head to the tail of each state, one row per
+    state.
+    """
+    return LINK_VECTORS[_digits(codes, link_count)].sum(axis=1)
+
+
+def end_to_end_squared(codes, link_count):
+    """end_to_end_squared(codes, link_count) -> int array"""
+    return (end_to_end(codes, link_count) ** 2).sum(axis=1)
+
+
+def radius_of_gyration_squared(codes, link_count):
+    """radius_of_gyration_squared(codes, link_count) -> float array
+
+    Returns the mean squared distance of the reptons from their center of
+    mass for each state.
+    """
+    found = positions(codes, link_count).astype(numpy.float64)
+    found -= found.mean(axis=1, keepdims=True)
+    return (found ** 2).sum(axis=2).mean(axis=1)
+
+
+def hernia_count(codes, link_count):
+    """hernia_count(codes, link_count) -> int array
+
+    Returns the number of pairs of consecutive links forming a hernia in each
+    state.
+    """
+    digits = _digits(codes, link_count)
+    return _IS_HERNIA[digits[:, :-1], digits[:, 1:]].sum(axis=1)
+
+
+def slack_count(codes, link_count):
+    """slack_count(codes, link_count) -> int array"""
+    slack = codec.DIGITS_BY_LINK[Link.SLACK]
+    return (_digits(codes, link_count) == slack).sum(axis=1)
+
+
+OBSERVABLES = {
+    'end_to_end_squared': end_to_end_squared,
+    'radius_of_gyration_squared': radius_of_gyration_squared,
+    'hernia_count': hernia_count,
+    'slack_count': slack_count,
+}
+
+
+def all_observables(link_count, names=None, chunk_size=1 << 18):
+    """all_observables(link_count[, names[, chunk_size]]) -> dict of arrays
+
+    Evaluates the named `OBSERVABLES`, all of them by default, for every state
+    in canonical order, looking at chunk_size states at a time.
+    """
+    if names is None:
+        names = sorted(OBSERVABLES)
+    unknown = set(names) - set(OBSERVABLES)
+    if unknown:
+        raise ValueError("unknown observables: {}".format(
+            ', '.join(sorted(unknown))))
+
+    state_count = codec.state_count(link_count)
+    found = {}
+    for start in range(0, state_count, chunk_size):
+        codes = enumeration.all_codes(
+            link_count, start, min(start + chunk_size, state_count))
+        for name in names:
+            values = OBSERVABLES[name](codes, link_count)
+            if name not in found:
+                found[name] = numpy.empty(state_count, values.dtype)
+            found[name][start:start + len(codes)] = values
+    return found
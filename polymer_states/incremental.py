@@ -0,0 +1,165 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Building transition structures of longer chains from shorter ones.
+
+The head link is a state code's most significant digit (see
+`polymer_states.codec`), so an n-link state is a head digit followed by an
+(n - 1)-link state, and Kronecker products with the head digit on the left
+extend matrices over (n - 1)-link states to n-link ones. Every move acts on a
+single link pair, so with R_n the matrix counting some kind of move,
+
+    R_n = I_5 (x) R_(n-1)
+        - I_5 (x) E (x) I_(5^(n-2))
+        + E (x) I_(5^(n-1))
+        + P (x) I_(5^(n-2)),
+
+where the first term moves the shorter chain's pairs along behind a new head,
+the second drops the moves the shorter chain's head end makes, which is no
+end any more, the third adds those of the new head end and the last those of
+the new pair formed by the first two links. E is the 5 x 5 matrix of head end
+moves and P the 25 x 25 one of moves of interior pairs, both read off
+`kernel.PAIR_TABLE`. The one link chain, whose only link is both ends, starts
+the ladder.
+
+Each step costs time proportional to the size of its result, so climbing
+the whole ladder of chain lengths costs about as much as its last rung.
+"""
+
+__all__ = ['PairMatrices', 'PAIR_MATRICES', 'one_link_matrices', 'extend',
+           'ladder', 'move_type_matrices']
+
+
+import collections
+
+import numpy
+import scipy.sparse
+
+from polymer_states import MoveType
+from polymer_states import codec, enumeration, kernel
+
+
+PairMatrices = collections.namedtuple(
+    'PairMatrices', ['head', 'tail', 'inner'])
+PairMatrices.__doc__ = """Counts of moves of single link pairs, per move type.
+
+`head` and `tail` map each `MoveType` to a 5 x 5 matrix counting the moves
+of the head and tail end links, indexed by link digit. `inner` does the same
+for interior link pairs with 25 x 25 matrices indexed by left digit * 5 +
+right digit.
+"""
+
+
+def _pair_matrices():
+    base = codec.LINK_BASE
+    table = kernel.PAIR_TABLE
+    matrices = PairMatrices(*(
+        {move_type: numpy.zeros((size, size), dtype=numpy.int64)
+         for move_type in sorted(MoveType.MOVE_TYPES)}
+        for size in (base, base, base * base)))
+
+    for left in range(base + 1):
+        for right in range(base + 1):
+            i = kernel.pair_ids(left, right)
+            for k in range(table.counts[i]):
+                move_type = MoveType(int(table.move_types[i, k]))
+                new_left = table.new_left[i, k]
+                new_right = table.new_right[i, k]
+                if left == kernel.NO_LINK:
+                    matrices.head[move_type][right, new_right] += 1
+                elif right == kernel.NO_LINK:
+                    matrices.tail[move_type][left, new_left] += 1
+                else:
+                    matrices.inner[move_type][
+                        left * base + right, new_left * base + new_right] += 1
+    return matrices
+
+
+PAIR_MATRICES = _pair_matrices()
+
+
+def _counts(matrix):
+    matrix = scipy.sparse.csr_matrix(matrix)
+    matrix.eliminate_zeros()
+    return matrix.astype(numpy.uint8)
+
+
+def one_link_matrices():
+    """one_link_matrices() -> dict
+
+    Returns the per move type count matrices of one link chains, in the form
+    of `polymer_states.sparse.move_type_matrices`.
+    """
+    return {
+        move_type: _counts(PAIR_MATRICES.head[move_type]
+                           + PAIR_MATRICES.tail[move_type])
+        for move_type in sorted(MoveType.MOVE_TYPES)
+    }
+
+
+def _identity(size):
+    return scipy.sparse.identity(size, dtype=numpy.int16, format='csr')
+
+
+def extend(matrices):
+    """extend(matrices) -> dict
+
+    Turns the per move type count matrices of chains with some number of
+    links into those of chains with one more link.
+    """
+    state_count = next(iter(matrices.values())).shape[0]
+    base = codec.LINK_BASE
+    rest = _identity(state_count // base)
+
+    extended = {}
+    for move_type, counts in matrices.items():
+        head = scipy.sparse.csr_matrix(
+            PAIR_MATRICES.head[move_type], dtype=numpy.int16)
+        inner = scipy.sparse.csr_matrix(
+            PAIR_MATRICES.inner[move_type], dtype=numpy.int16)
+        matrix = (
+            scipy.sparse.kron(_identity(base), counts.astype(numpy.int16),
+                              format='csr')
+            - scipy.sparse.kron(
+                _identity(base), scipy.sparse.kron(head, rest), format='csr')
+            + scipy.sparse.kron(head, _identity(state_count), format='csr')
+            + scipy.sparse.kron(inner, rest, format='csr'))
+        extended[move_type] = _counts(matrix)
+    return extended
+
+
+def ladder(max_link_count, min_link_count=1):
+    """ladder(max_link_count[, min_link_count])
+        -> iterator of (link_count, dict)
+
+    Yields the per move type count matrices of chains of every length from
+    min_link_count up to max_link_count, each built from the previous one.
+    """
+    if not 1 <= min_link_count <= max_link_count:
+        raise ValueError(
+            "need 1 <= min_link_count <= max_link_count, got {} and {}"
+            .format(min_link_count, max_link_count))
+    # Fail before climbing if the top rung can't be encoded.
+    codec.code_dtype(max_link_count)
+    return _ladder(max_link_count, min_link_count)
+
+
+def _ladder(max_link_count, min_link_count):
+    matrices = one_link_matrices()
+    for link_count in range(1, max_link_count + 1):
+        if link_count > 1:
+            matrices = extend(matrices)
+        if link_count >= min_link_count:
+            yield link_count, matrices
+
+
+def move_type_matrices(link_count):
+    """move_type_matrices(link_count) -> (dict, state codes)
+
+    Like `polymer_states.sparse.move_type_matrices`, but climbs the ladder of
+    chain lengths instead of computing every transition.
+    """
+    for _, matrices in ladder(link_count, link_count):
+        pass
+    return matrices, enumeration.all_codes(link_count)
@@ -0,0 +1,152 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Vectorized move kernel.
+
+Computes the transitions of many encoded states at once (see
+`polymer_states.codec`), one link pair position at a time, using whole-array
+operations instead of per-`Polymer` calls. The moves come from
+`PAIR_TRANSITIONS`, so the transitions are the same ones
+`Polymer.transition_rates` finds: one for every pair position, kind of move
+and resulting state.
+"""
+
+__all__ = ['NO_LINK', 'PAIR_BASE', 'PairTable', 'PAIR_TABLE', 'pair_ids',
+           'transitions', 'rate_lookup']
+
+
+import collections
+
+import numpy
+
+from polymer_states import MoveType, PAIR_TRANSITIONS, pair_displacement
+from polymer_states import codec
+
+
+# The digit standing in for the missing link of the pairs at the chain's ends.
+NO_LINK = codec.LINK_BASE
+PAIR_BASE = NO_LINK + 1
+
+
+PairTable = collections.namedtuple(
+    'PairTable',
+    ['counts', 'new_left', 'new_right', 'move_types', 'displacements'])
+PairTable.__doc__ = """PAIR_TRANSITIONS as arrays indexed by pair id.
+
+`counts[i]` is the number of moves possible for the pair with id i. For k
+smaller than that, `new_left[i, k]`, `new_right[i, k]` and `move_types[i, k]`
+describe the k-th one: the digits of the replacement pair and the move's
+`MoveType`. `displacements[i, k]` is the (x, y) lattice vector by which the
+move shifts the repton between the pair's links.
+"""
+
+
+def _link_digit(link):
+    return NO_LINK if link is None else codec.DIGITS_BY_LINK[link]
+
+
+def pair_ids(left, right):
+    """pair_ids(left, right) -> array
+
+    Returns the ids, as used by `PAIR_TABLE`, of the pairs of link digits
+    given. `NO_LINK` marks the missing links of end pairs.
+    """
+    return left * PAIR_BASE + right
+
+
+def _pair_table():
+    size = PAIR_BASE * PAIR_BASE
+    width = max(len(moves) for moves in PAIR_TRANSITIONS.values())
+    table = PairTable(
+        numpy.zeros(size, dtype=numpy.int64),
+        numpy.zeros((size, width), dtype=numpy.int64),
+        numpy.zeros((size, width), dtype=numpy.int64),
+        numpy.zeros((size, width), dtype=numpy.uint8),
+        numpy.zeros((size, width, 2), dtype=numpy.int8))
+
+    for pair, moves in PAIR_TRANSITIONS.items():
+        i = pair_ids(*map(_link_digit, pair))
+        table.counts[i] = len(moves)
+        for k, (new_pair, move_type) in enumerate(moves):
+            new_left, new_right = new_pair
+            table.new_left[i, k] = _link_digit(new_left)
+            table.new_right[i, k] = _link_digit(new_right)
+            table.move_types[i, k] = move_type
+            table.displacements[i, k] = pair_displacement(pair, new_pair)
+    return table
+
+
+PAIR_TABLE = _pair_table()
+
+
+def transitions(codes, link_count, displacements=False):
+    """transitions(codes, link_count[, displacements])
+        -> (sources, targets, move_types[, displacements])
+
+    Returns three aligned arrays describing every transition out of the states
+    with the given codes: the code of the state left, the code of the state
+    entered and the `MoveType` of the move as a uint8.
+
+    With displacements set, a fourth array holds the (x, y) lattice vector by
+    which each move shifts the repton it moves, as int8.
+    """
+    codes = numpy.asarray(codes, dtype=numpy.int64).reshape(-1)
+    digits = codec.decode_digits(codes, link_count).astype(numpy.int64)
+    digits = digits.reshape(-1, link_count)
+    dtype = codec.code_dtype(link_count)
+
+    no_link = numpy.full(len(codes), NO_LINK, dtype=numpy.int64)
+    sources, targets, move_types, shifts = [], [], [], []
+    for p in range(link_count + 1):
+        left = digits[:, p - 1] if p > 0 else no_link
+        right = digits[:, p] if p < link_count else no_link
+        left_weight = codec.LINK_BASE ** (link_count - p) if p > 0 else 0
+        right_weight = (
+            codec.LINK_BASE ** (link_count - p - 1) if p < link_count else 0)
+
+        ids = pair_ids(left, right)
+        counts = PAIR_TABLE.counts[ids]
+        for k in range(PAIR_TABLE.new_left.shape[1]):
+            selected = numpy.flatnonzero(counts > k)
+            if not len(selected):
+                break
+            selected_ids = ids[selected]
+
+            source = codes[selected]
+            target = (
+                source
+                + (PAIR_TABLE.new_left[selected_ids, k] - left[selected])
+                * left_weight
+                + (PAIR_TABLE.new_right[selected_ids, k] - right[selected])
+                * right_weight)
+
+            sources.append(source.astype(dtype))
+            targets.append(target.astype(dtype))
+            move_types.append(PAIR_TABLE.move_types[selected_ids, k])
+            if displacements:
+                shifts.append(PAIR_TABLE.displacements[selected_ids, k])
+
+    if sources:
+        result = (numpy.concatenate(sources), numpy.concatenate(targets),
+                  numpy.concatenate(move_types))
+    else:
+        result = (numpy.empty(0, dtype), numpy.empty(0, dtype),
+                  numpy.empty(0, numpy.uint8))
+    if displacements:
+        result += (numpy.concatenate(shifts) if shifts
+                   else numpy.empty((0, 2), numpy.int8),)
+    return result
+
+
+def rate_lookup(move_rates, zero=0.0):
+    """rate_lookup(move_rates[, zero]) -> float array
+
+    Returns an array mapping `MoveType` values, as found in the move_types
+    returned by `transitions`, to the rates in move_rates.
+    """
+    lookup = numpy.full(max(MoveType.VALID_MOVE_TYPE_VALUES) + 1, zero,
+                        dtype=numpy.float64)
+    for move_type, rate in move_rates.items():
+        lookup[move_type] = rate
+    return lookup
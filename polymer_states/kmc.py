@@ -0,0 +1,229 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Kinetic Monte Carlo simulation of single chains.
+
+Exact enumeration is limited to short chains, while a continuous time
+(Gillespie) simulation only ever looks at the moves possible for the current
+state. Those are local: the total rate of the moves at each link pair depends
+only on that pair (see `PAIR_TRANSITIONS`). The per pair totals are kept in a
+Fenwick tree, so after a move only the three pairs sharing its links need
+updating and every step takes O(log n) time.
+"""
+
+__all__ = ['FenwickTree', 'RunStats', 'Simulation']
+
+
+import collections
+import random
+import time
+
+from polymer_states import Polymer, PAIR_TRANSITIONS, pair_displacement
+
+
+class FenwickTree:
+    """A binary indexed tree of non-negative weights.
+
+    Supports changing a weight, summing all of them and finding the item at
+    which the running sum of weights crosses a value, all in O(log n) time.
+    """
+
+    def __init__(self, weights):
+        self.__weights = [0.0] * len(weights)
+        self.__tree = [0.0] * (len(weights) + 1)
+        self.rebuild(weights)
+
+    def __len__(self):
+        return len(self.__weights)
+
+    def rebuild(self, weights=None):
+        """T.rebuild([weights])
+
+        Recomputes the tree from scratch, getting rid of the rounding errors
+        accumulated by updates. New weights replace the current ones if given.
+        """
+        if weights is not None:
+            self.__weights = [float(weight) for weight in weights]
+        tree = [0.0] + self.__weights
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.__tree = tree
+
+    def weight(self, i):
+        """T.weight(i) -> float"""
+        return self.__weights[i]
+
+    def update(self, i, weight):
+        """T.update(i, weight)
+
+        Sets the i-th weight.
+        """
+        delta = weight - self.__weights[i]
+        self.__weights[i] = weight
+        i += 1
+        while i < len(self.__tree):
+            self.__tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        """T.total() -> float
+
+        Returns the sum of all weights.
+        """
+        return self.prefix_sum(len(self.__weights))
+
+    def prefix_sum(self, count):
+        """T.prefix_sum(count) -> float
+
+        Returns the sum of the first count weights.
+        """
+        total = 0.0
+        while count > 0:
+            total += self.__tree[count]
+            count -= count & -count
+        return total
+
+    def find(self, value):
+        """T.find(value) -> int
+
+        Returns the index of the first item at which the running sum of
+        weights exceeds value, skipping items with no weight. Values past the
+        total give the last item with a weight.
+        """
+        i, step = 0, 1 << len(self.__weights).bit_length()
+        while step:
+            j = i + step
+            if j < len(self.__tree) and self.__tree[j] <= value:
+                i = j
+                value -= self.__tree[j]
+            step >>= 1
+        while i >= len(self.__weights) or self.__weights[i] <= 0:
+            i -= 1
+        return i
+
+
+RunStats = collections.namedtuple(
+    'RunStats', ['steps', 'time', 'elapsed', 'steps_per_second'])
+RunStats.__doc__ = """The result of `Simulation.run`.
+
+`time` is the simulated time the steps took, `elapsed` the wall clock time
+they took in seconds.
+"""
+
+
+class Simulation:
+    """A continuous time simulation of a single chain.
+
+    Moves happen with the rates in `move_rates`, multiplied by
+    `bias ** (dx / 2)` for moves shifting a repton by dx along the field. See
+    `polymer_states.field`.
+    """
+
+    # How many steps to take between rebuilds of the Fenwick tree.
+    REBUILD_INTERVAL = 1 << 16
+
+    def __init__(self, polymer, move_rates, bias=1.0, seed=None):
+        self.__links = list(polymer.links())
+        self.__random = random.Random(seed)
+        self.__moves = {
+            pair: _weighted_moves(pair, moves, move_rates, bias)
+            for pair, moves in PAIR_TRANSITIONS.items()
+        }
+        self.__tree = FenwickTree(
+            [self.__pair_moves(p)[0] for p in range(len(self.__links) + 1)])
+        self.__time = 0.0
+        self.__steps = 0
+        self.__shift = [0, 0]
+
+    def polymer(self):
+        """S.polymer() -> a Polymer
+
+        Returns the current state of the chain.
+        """
+        return Polymer(self.__links)
+
+    def time(self):
+        """S.time() -> float
+
+        Returns the simulated time elapsed.
+        """
+        return self.__time
+
+    def steps(self):
+        """S.steps() -> int"""
+        return self.__steps
+
+    def center_of_mass_shift(self):
+        """S.center_of_mass_shift() -> (x, y)
+
+        Returns the displacement of the chain's center of mass since the start.
+        """
+        reptons = len(self.__links) + 1
+        return tuple(shift / reptons for shift in self.__shift)
+
+    def __pair(self, p):
+        links = self.__links
+        return (links[p - 1] if p > 0 else None,
+                links[p] if p < len(links) else None)
+
+    def __pair_moves(self, p):
+        return self.__moves[self.__pair(p)]
+
+    def step(self):
+        """S.step() -> float
+
+        Makes a single move and returns the time it took.
+        """
+        total = self.__tree.total()
+        if total <= 0:
+            raise RuntimeError("no move is possible")
+        waited = self.__random.expovariate(total)
+
+        p = self.__tree.find(self.__random.random() * total)
+        pair_total, moves = self.__pair_moves(p)
+        value = self.__random.random() * pair_total
+        for (new_left, new_right), rate, (dx, dy) in moves:
+            value -= rate
+            if value < 0:
+                break
+
+        if p > 0:
+            self.__links[p - 1] = new_left
+        if p < len(self.__links):
+            self.__links[p] = new_right
+        for q in range(max(p - 1, 0), min(p + 2, len(self.__links) + 1)):
+            self.__tree.update(q, self.__pair_moves(q)[0])
+
+        self.__shift[0] += dx
+        self.__shift[1] += dy
+        self.__time += waited
+        self.__steps += 1
+        if self.__steps % self.REBUILD_INTERVAL == 0:
+            self.__tree.rebuild()
+        return waited
+
+    def run(self, steps):
+        """S.run(steps) -> a RunStats
+
+        Makes the given number of moves and reports how fast that went.
+        """
+        start_time, start = self.__time, time.perf_counter()
+        for _ in range(steps):
+            self.step()
+        elapsed = time.perf_counter() - start
+        return RunStats(
+            steps, self.__time - start_time, elapsed,
+            steps / elapsed if elapsed > 0 else float('inf'))
+
+
+def _weighted_moves(pair, moves, move_rates, bias):
+    weighted = []
+    for new_pair, move_type in moves:
+        displacement = pair_displacement(pair, new_pair)
+        rate = move_rates.get(move_type, 0) * bias ** (displacement[0] / 2)
+        if rate > 0:
+            weighted.append((new_pair, rate, displacement))
+    return sum(rate for _, rate, _ in weighted), tuple(weighted)
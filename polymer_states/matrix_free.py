@@ -0,0 +1,146 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""The generator matrix as a matrix-free linear operator.
+
+Products with the generator Q and its transpose are computed straight from
+the state codes: a chunk of states at a time is run through
+`kernel.transitions`, which applies every move's local rule to all states of
+the chunk at once, and the resulting rates are scattered into the result.
+Only the exit rates, which make up Q's diagonal, are kept between products,
+so memory use is a few vectors of the state count, and the iterative methods
+of `polymer_states.stationary` work for chains whose sparse matrix wouldn't
+fit in memory.
+
+States are indexed by their codes, which is canonical order (see
+`polymer_states.enumeration`).
+"""
+
+__all__ = ['DEFAULT_CHUNK_SIZE', 'GeneratorOperator', 'exit_rates']
+
+
+import numpy
+import scipy.sparse.linalg
+
+from polymer_states import codec, enumeration, kernel
+
+
+# How many states to compute the transitions of at a time.
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+def _chunks(link_count, chunk_size):
+    state_count = codec.state_count(link_count)
+    for start in range(0, state_count, chunk_size):
+        yield start, enumeration.all_codes(
+            link_count, start, min(start + chunk_size, state_count))
+
+
+def _transition_rates(codes, link_count, lookup, bias):
+    if bias == 1:
+        sources, targets, move_types = kernel.transitions(codes, link_count)
+        rates = lookup[move_types]
+    else:
+        sources, targets, move_types, displacements = kernel.transitions(
+            codes, link_count, displacements=True)
+        rates = lookup[move_types] * bias ** (displacements[:, 0] / 2)
+    return (sources.astype(numpy.int64), targets.astype(numpy.int64),
+            rates)
+
+
+def exit_rates(link_count, move_rates, bias=1.0,
+               chunk_size=DEFAULT_CHUNK_SIZE):
+    """exit_rates(link_count, move_rates[, bias[, chunk_size]]) -> array
+
+    Returns the total rate of leaving each state of a link_count link chain,
+    the negated diagonal of its generator. See `polymer_states.field` for the
+    meaning of bias.
+    """
+    lookup = kernel.rate_lookup(move_rates)
+    rates = numpy.empty(codec.state_count(link_count))
+    for start, codes in _chunks(link_count, chunk_size):
+        sources, _, transition_rates = _transition_rates(
+            codes, link_count, lookup, bias)
+        rates[start:start + len(codes)] = numpy.bincount(
+            sources - start, transition_rates, minlength=len(codes))
+    return rates
+
+
+class GeneratorOperator(scipy.sparse.linalg.LinearOperator):
+    """The generator matrix of a link_count link chain as a LinearOperator.
+
+    Equal to `sparse.transition_matrix(link_count, move_rates,
+    diagonal=True)`, or with a bias to `field.combine(..., diagonal=True)`,
+    but computing its products on the fly.
+    """
+
+    def __init__(self, link_count, move_rates, bias=1.0,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        state_count = codec.state_count(link_count)
+        super().__init__(numpy.float64, (state_count, state_count))
+        self.link_count = link_count
+        self.bias = bias
+        self.chunk_size = chunk_size
+        self.__lookup = kernel.rate_lookup(move_rates)
+        self.__exit_rates = exit_rates(link_count, move_rates, bias, chunk_size)
+
+    def diagonal(self):
+        """G.diagonal() -> array
+
+        Returns the diagonal of the generator.
+        """
+        return -self.__exit_rates
+
+    def __transitions(self):
+        for start, codes in _chunks(self.link_count, self.chunk_size):
+            yield start, codes, _transition_rates(
+                codes, self.link_count, self.__lookup, self.bias)
+
+    def _matvec(self, x):
+        x = numpy.ravel(x)
+        result = -self.__exit_rates * x
+        for start, codes, (sources, targets, rates) in self.__transitions():
+            result[start:start + len(codes)] += numpy.bincount(
+                sources - start, rates * x[targets], minlength=len(codes))
+        return result
+
+    def _rmatvec(self, x):
+        x = numpy.ravel(x)
+        result = -self.__exit_rates * x
+        for _, _, (sources, targets, rates) in self.__transitions():
+            # Only touch the targets the chunk reaches: a bincount over all
+            # states per chunk would make the product quadratic in them.
+            touched, positions = numpy.unique(targets, return_inverse=True)
+            result[touched] += numpy.bincount(
+                positions.ravel(), rates * x[sources], minlength=len(touched))
+        return result
+
+    def _transpose(self):
+        # Going through the base class would lose diagonal().
+        return _TransposedOperator(self)
+
+    _adjoint = _transpose
+
+
+class _TransposedOperator(scipy.sparse.linalg.LinearOperator):
+
+    def __init__(self, operator):
+        super().__init__(operator.dtype, operator.shape[::-1])
+        self.operator = operator
+
+    def diagonal(self):
+        return self.operator.diagonal()
+
+    def _matvec(self, x):
+        return self.operator.rmatvec(x)
+
+    def _rmatvec(self, x):
+        return self.operator.matvec(x)
+
+    def _transpose(self):
+        return self.operator
+
+    _adjoint = _transpose
@@ -0,0 +1,155 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Building transition matrices larger than memory.
+
+`build` runs in two passes over the states, holding no more than a chunk's
+worth of transitions in memory at a time:
+
+1. The transitions of chunk_size states at a time are computed with
+   `kernel.transitions`, sorted and summed per (row, column) pair, and
+   appended to raw row, column and rate files.
+2. Those files are memory mapped and copied, chunk by chunk, into the parts
+   of a CSR matrix stored as `.npy` files. Chunks cover consecutive states, so
+   their rows are already in order and the row pointers follow from counting.
+
+The result is loaded with `load`, which memory maps the `.npy` files, so
+iterative solvers can run on matrices the machine couldn't hold in memory.
+"""
+
+__all__ = ['DEFAULT_CHUNK_SIZE', 'build', 'load']
+
+
+import os
+import shutil
+
+import numpy
+import numpy.lib.format
+import scipy.sparse
+
+from polymer_states import codec, enumeration, kernel, sparse
+
+
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+_CSR_PARTS = ('data', 'indices', 'indptr')
+_COO_PARTS = (('rows', numpy.int64), ('columns', numpy.int64),
+              ('rates', numpy.float64))
+
+
+def _chunk_transitions(codes, link_count, lookup, diagonal):
+    sources, targets, move_types = kernel.transitions(codes, link_count)
+    sources = sources.astype(numpy.int64)
+    targets = targets.astype(numpy.int64)
+    rates = lookup[move_types]
+    kept = rates != 0
+    sources, targets, rates = sources[kept], targets[kept], rates[kept]
+
+    if diagonal:
+        start = int(codes[0])
+        exit_rates = numpy.bincount(
+            sources - start, weights=rates, minlength=len(codes))
+        states = codes.astype(numpy.int64)
+        sources = numpy.concatenate((sources, states))
+        targets = numpy.concatenate((targets, states))
+        rates = numpy.concatenate((rates, -exit_rates))
+
+    order = numpy.lexsort((targets, sources))
+    sources, targets, rates = sources[order], targets[order], rates[order]
+    first = numpy.ones(len(sources), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    starts = numpy.flatnonzero(first)
+    return (sources[starts], targets[starts],
+            numpy.add.reduceat(rates, starts) if len(starts) else rates)
+
+
+def build(link_count, move_rates, directory, diagonal=False,
+          chunk_size=DEFAULT_CHUNK_SIZE, keep_chunks=False):
+    """build(link_count, move_rates, directory[, diagonal[, chunk_size[,
+    keep_chunks]]]) -> str
+
+    Builds the transition matrix of link_count link chains in directory,
+    computing the transitions of chunk_size states at a time, and returns the
+    directory. The intermediate COO files are removed unless keep_chunks is
+    set. See `polymer_states.sparse.from_transitions` for the meaning of
+    diagonal.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    os.makedirs(directory, exist_ok=True)
+    chunk_dir = os.path.join(directory, 'coo')
+    os.makedirs(chunk_dir, exist_ok=True)
+    state_count = codec.state_count(link_count)
+    lookup = kernel.rate_lookup(move_rates)
+
+    files = {
+        name: open(os.path.join(chunk_dir, name + '.bin'), 'wb')
+        for name, _ in _COO_PARTS
+    }
+    chunks, entry_count = [], 0
+    try:
+        for start in range(0, state_count, chunk_size):
+            codes = enumeration.all_codes(
+                link_count, start, min(start + chunk_size, state_count))
+            found = _chunk_transitions(codes, link_count, lookup, diagonal)
+            for (name, dtype), values in zip(_COO_PARTS, found):
+                files[name].write(values.astype(dtype).tobytes())
+            chunks.append((start, start + len(codes),
+                           entry_count, entry_count + len(found[0])))
+            entry_count += len(found[0])
+    finally:
+        for file in files.values():
+            file.close()
+
+    _merge(chunk_dir, directory, state_count, chunks, entry_count)
+    if not keep_chunks:
+        shutil.rmtree(chunk_dir)
+    return directory
+
+
+def _merge(chunk_dir, directory, state_count, chunks, entry_count):
+    coo = {
+        name: numpy.memmap(os.path.join(chunk_dir, name + '.bin'),
+                           dtype=dtype, mode='r', shape=(entry_count,))
+        if entry_count else numpy.empty(0, dtype)
+        for name, dtype in _COO_PARTS
+    }
+
+    index_type = sparse.index_dtype(max(state_count, entry_count))
+    csr = {
+        name: numpy.lib.format.open_memmap(
+            os.path.join(directory, name + '.npy'), mode='w+', dtype=dtype,
+            shape=(shape,))
+        for name, dtype, shape in [
+            ('data', numpy.float64, entry_count),
+            ('indices', index_type, entry_count),
+            ('indptr', index_type, state_count + 1),
+        ]
+    }
+
+    csr['indptr'][0] = 0
+    for first_state, stop_state, begin, end in chunks:
+        csr['data'][begin:end] = coo['rates'][begin:end]
+        csr['indices'][begin:end] = coo['columns'][begin:end]
+        counts = numpy.bincount(coo['rows'][begin:end] - first_state,
+                                minlength=stop_state - first_state)
+        csr['indptr'][first_state + 1:stop_state + 1] = (
+            begin + numpy.cumsum(counts))
+
+    for array in csr.values():
+        array.flush()
+
+
+def load(directory, mmap_mode='r'):
+    """load(directory[, mmap_mode]) -> CSR matrix
+
+    Loads a matrix made by `build`, memory mapping its parts with the given
+    `numpy.load` mmap_mode.
+    """
+    data, indices, indptr = (
+        numpy.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+        for name in _CSR_PARTS)
+    state_count = len(indptr) - 1
+    return scipy.sparse.csr_matrix(
+        (data, indices, indptr), shape=(state_count, state_count), copy=False)
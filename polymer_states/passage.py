@@ -0,0 +1,265 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""First passage times between sets of states.
+
+Let T be the time a chain started in state i takes to first enter the target
+set A. Its moments m_k(i) = E[T^k] vanish on A and, with B the states outside
+A and Q_BB the generator restricted to them, solve
+
+    Q_BB m_k = -k m_(k - 1),    m_0 = 1.
+
+Q_BB changes with the target, so small targets go through the fundamental
+matrix Z of the whole chain instead, which solves Q Z = 1 pi^T - I with
+pi^T Z = 0, pi being the stationary distribution. Any m vanishing on A with
+(Q m)_B = r_B is
+
+    m = Z h + Z_(:, A) f + c 1,
+
+where h is -r on B and zero on A, and the |A| + 1 unknowns f and c solve the
+small dense system Z_AA f + c 1 = -(Z h)_A, pi_A^T f = pi_B^T r_B. For a single
+target state j that is the classic m_i = (Z_jj - Z_ij) / pi_j. Products with
+Z take one solve with Q less the last state's row and column, which is
+factorized once for all targets, and the columns of Z belonging to target
+states are kept and shared by every target containing them. Large chains use
+a Jacobi preconditioned BiCGSTAB instead of the factorization, as in
+`polymer_states.stationary`, which still reuses the columns.
+
+State sets can be given as boolean masks over the states in canonical order,
+as arrays of state codes or as predicates taking a `Polymer`, such as
+`Polymer.contains_hernia`. Predicates are evaluated on every state, one
+`Polymer` at a time, so masks are the better choice for long chains.
+"""
+
+__all__ = ['METHODS', 'state_mask', 'FirstPassage']
+
+
+import collections
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+
+from polymer_states import CacheInfo
+from polymer_states import codec, enumeration, stationary
+
+
+METHODS = ('auto', 'direct', 'bicgstab')
+
+
+def state_mask(states, state_count):
+    """state_mask(states, state_count) -> boolean array
+
+    Turns a set of states, given as a boolean mask, an array of codes or a
+    predicate on `Polymer`s, into a boolean mask over all states.
+    """
+    if callable(states):
+        link_count = _link_count(state_count)
+        polymers = enumeration.iter_states(link_count)
+        return numpy.fromiter(map(states, polymers), dtype=bool,
+                              count=state_count)
+    states = numpy.asarray(states)
+    if states.dtype == bool:
+        if states.shape != (state_count,):
+            raise ValueError("a state mask needs one entry per state")
+        return states
+    mask = numpy.zeros(state_count, dtype=bool)
+    mask[states.astype(numpy.int64)] = True
+    return mask
+
+
+def _link_count(state_count):
+    link_count = 0
+    while codec.state_count(link_count) < state_count:
+        link_count += 1
+    if codec.state_count(link_count) != state_count:
+        raise ValueError(
+            "{} isn't the state count of any chain".format(state_count))
+    return link_count
+
+
+class FirstPassage:
+    """First passage time moments for a chain with the given sparse generator.
+
+    method is one of `METHODS`. 'auto' picks 'direct' for up to
+    `polymer_states.stationary.DIRECT_STATE_LIMIT` states and 'bicgstab'
+    otherwise, which solves to the relative tolerance tol.
+
+    Targets of up to schur_limit states are handled through the fundamental
+    matrix, whose columns for the last cache_size target states used are
+    kept for all later targets containing them. Larger targets get a system
+    of their own, solved afresh on every call.
+    """
+
+    def __init__(self, generator, method='auto', tol=1e-10, cache_size=64,
+                 schur_limit=32):
+        if method not in METHODS:
+            raise ValueError("unknown method {!r}".format(method))
+        self.__generator = scipy.sparse.csr_matrix(generator)
+        if method == 'auto':
+            method = ('direct'
+                      if self.state_count() <= stationary.DIRECT_STATE_LIMIT
+                      else 'bicgstab')
+        self.method = method
+        self.tol = tol
+        self.cache_size = cache_size
+        self.schur_limit = schur_limit
+        self.__fundamental_parts = None
+        self.__columns = collections.OrderedDict()
+        self.__hits = self.__misses = 0
+
+    def state_count(self):
+        """F.state_count() -> int"""
+        return self.__generator.shape[0]
+
+    def cache_info(self):
+        """F.cache_info() -> a CacheInfo
+
+        Returns the hit and miss counts of the kept fundamental matrix
+        columns along with their number.
+        """
+        return CacheInfo(self.__hits, self.__misses, self.cache_size,
+                         len(self.__columns))
+
+    def clear_cache(self):
+        """F.clear_cache()
+
+        Forgets the fundamental matrix columns kept for reuse.
+        """
+        self.__columns.clear()
+        self.__hits = self.__misses = 0
+
+    def __solver(self, matrix):
+        if self.method == 'direct':
+            return scipy.sparse.linalg.splu(
+                matrix.tocsc(), permc_spec='MMD_AT_PLUS_A')
+        return _iterative_solver(matrix.tocsr(), self.tol)
+
+    def __fundamental_setup(self):
+        if self.__fundamental_parts is None:
+            reduced = self.__generator[:-1, :-1]
+            solver = self.__solver(reduced)
+            if self.method == 'direct':
+                # pi Q = 0 with the last state's probability fixed to one.
+                last_row = self.__generator[-1, :-1].toarray().ravel()
+                stationary_head = solver.solve(-last_row, trans='T')
+                pi = numpy.append(stationary_head, 1.0)
+                pi /= pi.sum()
+                solve = solver.solve
+            else:
+                pi = stationary.stationary_distribution(
+                    self.__generator, tol=self.tol).distribution
+                solve = solver
+            self.__fundamental_parts = solve, pi
+        return self.__fundamental_parts
+
+    def __fundamental(self, rhs):
+        """Solves Q z = rhs, for rhs orthogonal to pi, with pi^T z = 0."""
+        solve, pi = self.__fundamental_setup()
+        z = numpy.append(solve(rhs[:-1]), 0.0)
+        return z - pi.dot(z)
+
+    def __column(self, state):
+        if state in self.__columns:
+            self.__hits += 1
+            self.__columns.move_to_end(state)
+            return self.__columns[state]
+
+        self.__misses += 1
+        _, pi = self.__fundamental_setup()
+        rhs = numpy.full(self.state_count(), pi[state])
+        rhs[state] -= 1
+        column = self.__fundamental(rhs)
+        if self.cache_size:
+            self.__columns[state] = column
+            while len(self.__columns) > self.cache_size:
+                self.__columns.popitem(last=False)
+        return column
+
+    def moments(self, target, order=1):
+        """F.moments(target[, order]) -> 2D array
+
+        Returns the first order moments of the time to reach the target
+        states from every state, one row per moment.
+        """
+        if order < 1:
+            raise ValueError("order must be at least one")
+        target = state_mask(target, self.state_count())
+        if not target.any():
+            raise ValueError("the target set is empty")
+
+        inside = numpy.flatnonzero(target)
+        if len(inside) <= self.schur_limit:
+            return self.__schur_moments(inside, order)
+        return self.__restricted_moments(target, order)
+
+    def __schur_moments(self, inside, order):
+        _, pi = self.__fundamental_setup()
+        columns = numpy.column_stack([self.__column(j) for j in inside])
+        size = len(inside)
+        bordered = numpy.zeros((size + 1, size + 1))
+        bordered[:size, :size] = columns[inside]
+        bordered[:size, size] = 1
+        bordered[size, :size] = pi[inside]
+
+        moments = numpy.zeros((order, self.state_count()))
+        previous = numpy.ones(self.state_count())
+        for k in range(1, order + 1):
+            rhs = -k * previous
+            rhs[inside] = 0
+            moved = self.__fundamental(-pi.dot(rhs) + rhs)
+            weights = numpy.linalg.solve(
+                bordered, numpy.append(-moved[inside], pi.dot(rhs)))
+            previous = moved + columns.dot(weights[:size]) + weights[size]
+            previous[inside] = 0
+            moments[k - 1] = previous
+        return moments
+
+    def __restricted_moments(self, target, order):
+        outside = numpy.flatnonzero(~target)
+        solver = self.__solver(self.__generator[outside][:, outside])
+        solve = solver.solve if self.method == 'direct' else solver
+
+        moments = numpy.zeros((order, self.state_count()))
+        previous = numpy.ones(len(outside))
+        for k in range(1, order + 1):
+            previous = solve(-k * previous)
+            moments[k - 1, outside] = previous
+        return moments
+
+    def mean_time(self, source, target, order=1, weights=None):
+        """F.mean_time(source, target[, order[, weights]]) -> array
+
+        Returns the first order moments of the time to reach the target
+        states, averaged over the source states. The sources are weighted
+        evenly unless weights, a distribution over all states, is given.
+        """
+        source = state_mask(source, self.state_count())
+        if weights is None:
+            weights = source.astype(numpy.float64)
+        else:
+            weights = numpy.where(source, weights, 0.0)
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("the source set has no weight")
+        return self.moments(target, order).dot(weights / total)
+
+
+def _iterative_solver(reduced, tol):
+    diagonal = reduced.diagonal()
+    preconditioner = scipy.sparse.linalg.LinearOperator(
+        reduced.shape, matvec=lambda x: numpy.ravel(x) / diagonal,
+        dtype=numpy.float64)
+    tolerance = stationary.tolerance_keyword(scipy.sparse.linalg.bicgstab)
+
+    def solve(rhs):
+        solution, info = scipy.sparse.linalg.bicgstab(
+            reduced, rhs, x0=rhs / diagonal, M=preconditioner,
+            **{tolerance: tol})
+        if info != 0:
+            raise RuntimeError(
+                "BiCGSTAB failed to converge (info = {})".format(info))
+        return solution
+
+    return solve
@@ -0,0 +1,128 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Rasterizing transition matrices into fixed-size images.
+
+A matrix with more states than the image has pixels per side is drawn by
+splitting it into equal blocks, one per pixel, and aggregating the rates
+falling into each block. The nonzeros are streamed through in chunks, so
+neither a dense matrix nor a full list of transitions is ever needed: the
+transitions can also come straight from `kernel.transitions`, a chunk of
+states at a time.
+"""
+
+__all__ = ['AGGREGATES', 'DEFAULT_SIZE', 'rasterize', 'rasterize_matrix',
+           'rasterize_transitions', 'normalize']
+
+
+import numpy
+
+from polymer_states import codec, enumeration, kernel
+
+
+AGGREGATES = ('max', 'sum', 'count')
+
+DEFAULT_SIZE = 1024
+
+
+def _pixel(indices, state_count, size):
+    return indices.astype(numpy.int64) * size // state_count
+
+
+def rasterize(chunks, state_count, size=DEFAULT_SIZE, aggregate='max'):
+    """rasterize(chunks, state_count[, size[, aggregate]]) -> 2D array
+
+    Draws the entries of a state_count by state_count matrix, given as an
+    iterable of (rows, columns, values) array triples, into an image with
+    size pixels per side, or one per state if there are fewer states than
+    that. Each pixel holds the maximum, sum or count of the values falling
+    into it, depending on aggregate, which is one of `AGGREGATES`.
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError("unknown aggregate {!r}".format(aggregate))
+    if size < 1:
+        raise ValueError("the image size must be positive")
+
+    size = min(size, state_count)
+    image = numpy.zeros(size * size)
+    for rows, columns, values in chunks:
+        pixels = (_pixel(rows, state_count, size) * size
+                  + _pixel(columns, state_count, size))
+        if aggregate == 'max':
+            numpy.maximum.at(image, pixels, values)
+        elif aggregate == 'sum':
+            image += numpy.bincount(pixels, values, minlength=len(image))
+        else:
+            image += numpy.bincount(pixels, minlength=len(image))
+    return image.reshape(size, size)
+
+
+def _matrix_chunks(matrix, chunk_size):
+    matrix = matrix.tocsr()
+    for start in range(0, matrix.shape[0], chunk_size):
+        stop = min(start + chunk_size, matrix.shape[0])
+        begin, end = matrix.indptr[start], matrix.indptr[stop]
+        rows = numpy.repeat(
+            numpy.arange(start, stop), numpy.diff(matrix.indptr[start:stop + 1]))
+        yield rows, matrix.indices[begin:end], matrix.data[begin:end]
+
+
+def rasterize_matrix(matrix, size=DEFAULT_SIZE, aggregate='max',
+                     chunk_size=1 << 16):
+    """rasterize_matrix(matrix[, size[, aggregate[, chunk_size]]]) -> 2D array
+
+    Rasterizes a sparse matrix, chunk_size rows at a time. See `rasterize`.
+    """
+    return rasterize(_matrix_chunks(matrix, chunk_size), matrix.shape[0],
+                     size, aggregate)
+
+
+def _transition_chunks(link_count, move_rates, chunk_size):
+    lookup = kernel.rate_lookup(move_rates)
+    state_count = codec.state_count(link_count)
+    for start in range(0, state_count, chunk_size):
+        codes = enumeration.all_codes(
+            link_count, start, min(start + chunk_size, state_count))
+        sources, targets, move_types = kernel.transitions(codes, link_count)
+        rates = lookup[move_types]
+        # Like sparse.from_transitions, drop moves without a rate.
+        kept = rates != 0
+        yield sources[kept], targets[kept], rates[kept]
+
+
+def rasterize_transitions(link_count, move_rates, size=DEFAULT_SIZE,
+                          aggregate='max', chunk_size=1 << 16):
+    """rasterize_transitions(link_count, move_rates[, size[, aggregate[,
+    chunk_size]]]) -> 2D array
+
+    Rasterizes the transition matrix of link_count link chains without
+    building it, computing the transitions of chunk_size states at a time.
+    Transitions sharing their source and target are drawn separately, which
+    only matters to 'max' and 'count' for single link chains. See `rasterize`.
+    """
+    return rasterize(_transition_chunks(link_count, move_rates, chunk_size),
+                     codec.state_count(link_count), size, aggregate)
+
+
+def normalize(image, log=False):
+    """normalize(image[, log]) -> 2D array
+
+    Scales a rasterized image into [0, 1]. With log set, nonzero pixels are
+    scaled logarithmically between the smallest and largest nonzero values,
+    with the smallest mapped to a tenth of full brightness so it stays
+    visible.
+    """
+    image = numpy.asarray(image, dtype=numpy.float64)
+    nonzero = image > 0
+    if not nonzero.any():
+        return numpy.zeros_like(image)
+    if not log:
+        return image / image.max()
+
+    scaled = numpy.zeros_like(image)
+    logs = numpy.log(image[nonzero])
+    low, high = logs.min(), logs.max()
+    span = high - low
+    scaled[nonzero] = 0.1 + 0.9 * ((logs - low) / span if span else 1.0)
+    return scaled
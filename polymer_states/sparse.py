@@ -0,0 +1,164 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Sparse transition matrices.
+
+Rows and columns are indexed by state rank in canonical order (see
+`polymer_states.enumeration`), so the state index array accompanying a matrix
+is simply the array of all state codes. Entry (i, j) holds the rate of going
+from state i to state j.
+"""
+
+__all__ = ['FORMATS', 'index_dtype', 'transitions', 'from_transitions',
+           'transition_matrix', 'move_type_matrices', 'combine',
+           'with_diagonal']
+
+
+import numpy
+import scipy.sparse
+
+from polymer_states import MoveType
+from polymer_states import codec, enumeration, kernel
+
+
+FORMATS = ('csr', 'coo')
+
+
+def index_dtype(count):
+    """index_dtype(count) -> numpy dtype
+
+    Returns the index type to use for arrays indexing count items.
+    """
+    if count <= numpy.iinfo(numpy.int32).max:
+        return numpy.dtype(numpy.int32)
+    return numpy.dtype(numpy.int64)
+
+
+def transitions(link_count, move_rates):
+    """transitions(link_count, move_rates) -> (sources, targets, rates)
+
+    Returns the transition rates between all states of link_count link chains
+    as three aligned arrays. Transitions with the same source and target are
+    not combined.
+    """
+    codes = enumeration.all_codes(link_count)
+    sources, targets, move_types = kernel.transitions(codes, link_count)
+    dtype = index_dtype(len(codes))
+    rates = kernel.rate_lookup(move_rates)[move_types]
+    return sources.astype(dtype), targets.astype(dtype), rates
+
+
+def from_transitions(sources, targets, rates, state_count, format='csr',
+                     diagonal=False):
+    """from_transitions(sources, targets, rates, state_count[, format[,
+    diagonal]]) -> sparse matrix
+
+    Builds a state_count x state_count matrix out of transition triples.
+    Repeated (source, target) pairs are summed.
+
+    With diagonal set, the diagonal holds minus the total rate of leaving each
+    state, making the result a generator matrix with rows summing to zero.
+    """
+    _check_format(format)
+
+    dtype = index_dtype(state_count)
+    sources = numpy.asarray(sources, dtype=dtype)
+    targets = numpy.asarray(targets, dtype=dtype)
+    rates = numpy.asarray(rates, dtype=numpy.float64)
+
+    if diagonal:
+        exit_rates = numpy.bincount(
+            sources, weights=rates, minlength=state_count)
+        states = numpy.arange(state_count, dtype=dtype)
+        sources = numpy.concatenate((sources, states))
+        targets = numpy.concatenate((targets, states))
+        rates = numpy.concatenate((rates, -exit_rates))
+
+    matrix = scipy.sparse.coo_matrix(
+        (rates, (sources, targets)), shape=(state_count, state_count))
+    if format == 'csr':
+        matrix = matrix.tocsr()
+    return matrix
+
+
+def transition_matrix(link_count, move_rates, format='csr', diagonal=False):
+    """transition_matrix(link_count, move_rates[, format[, diagonal]])
+        -> (sparse matrix, state codes)
+
+    Builds the sparse matrix of transition rates between all states of
+    link_count link chains, given that `move_rates` maps kinds of moves to
+    rates. See `from_transitions` for the meaning of format and diagonal.
+    """
+    _check_format(format)
+    sources, targets, rates = transitions(link_count, move_rates)
+    state_count = codec.state_count(link_count)
+    matrix = from_transitions(
+        sources, targets, rates, state_count, format, diagonal)
+    return matrix, enumeration.all_codes(link_count)
+
+
+def move_type_matrices(link_count, format='csr'):
+    """move_type_matrices(link_count[, format]) -> (dict, state codes)
+
+    Decomposes the transition structure of link_count link chains by kind of
+    move. Returns a dictionary mapping every `MoveType` to a sparse matrix
+    counting the moves of that type between each pair of states, along with
+    the codes of the states indexing them.
+
+    The structure doesn't depend on the rates, so it can be built once and
+    turned into a rate matrix for any `move_rates` with `combine`.
+    """
+    _check_format(format)
+    codes = enumeration.all_codes(link_count)
+    sources, targets, move_types = kernel.transitions(codes, link_count)
+    dtype = index_dtype(len(codes))
+    sources, targets = sources.astype(dtype), targets.astype(dtype)
+
+    matrices = {}
+    for move_type in sorted(MoveType.MOVE_TYPES):
+        of_type = move_types == move_type
+        matrix = scipy.sparse.coo_matrix(
+            (numpy.ones(of_type.sum(), dtype=numpy.uint8),
+             (sources[of_type], targets[of_type])),
+            shape=(len(codes), len(codes)))
+        if format == 'csr':
+            matrix = matrix.tocsr()
+        matrices[move_type] = matrix
+    return matrices, codes
+
+
+def combine(matrices, move_rates, diagonal=False):
+    """combine(matrices, move_rates[, diagonal]) -> sparse matrix
+
+    Weights the per move type matrices returned by `move_type_matrices` with
+    the rates in move_rates and sums them into a CSR rate matrix. Move types
+    missing from move_rates have a zero rate. See `with_diagonal` for the
+    meaning of diagonal.
+    """
+    state_count = next(iter(matrices.values())).shape[0]
+    matrix = scipy.sparse.csr_matrix(
+        (state_count, state_count), dtype=numpy.float64)
+    for move_type, counts in matrices.items():
+        rate = move_rates.get(move_type, 0)
+        if rate:
+            matrix = matrix + rate * counts.tocsr()
+    if diagonal:
+        matrix = with_diagonal(matrix)
+    return matrix
+
+
+def with_diagonal(matrix):
+    """with_diagonal(matrix) -> CSR matrix
+
+    Returns a generator matrix made out of a matrix of transition rates: its
+    diagonal holds minus the total rate of leaving each state, so rows sum to
+    zero.
+    """
+    exit_rates = numpy.asarray(matrix.sum(axis=1)).ravel()
+    return (matrix - scipy.sparse.diags(exit_rates, format='csr')).tocsr()
+
+
+def _check_format(format):
+    if format not in FORMATS:
+        raise ValueError("unsupported sparse format {!r}".format(format))
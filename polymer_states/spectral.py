@@ -0,0 +1,130 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Slowest relaxation modes of the polymer Markov chain.
+
+All eigenvalues of a generator matrix Q have non-positive real parts, the
+stationary distribution belonging to the eigenvalue zero. Starting from any
+distribution, the chain approaches the stationary one like exp(lambda_2 t),
+with lambda_2 the eigenvalue with the next largest real part, so the
+relaxation time is -1 / Re lambda_2 and the spectral gap -Re lambda_2.
+
+The eigenvalues are found with ARPACK, either directly, which only needs
+products with Q and so also works matrix-free, or in shift-invert mode around
+a small positive shift, which converges much faster but factorizes Q. The
+chain isn't reversible, even without a field, so symmetric eigensolvers don't
+apply and the eigenvalues may come in complex conjugate pairs.
+"""
+
+__all__ = ['METHODS', 'Spectrum', 'spectrum', 'relaxation_time']
+
+
+import collections
+import time
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+
+from polymer_states import field, sparse, stationary
+from polymer_states.matrix_free import GeneratorOperator
+
+
+METHODS = ('auto', 'arnoldi', 'shift-invert')
+
+
+Spectrum = collections.namedtuple(
+    'Spectrum',
+    ['eigenvalues', 'eigenvectors', 'gap', 'relaxation_time', 'elapsed',
+     'method'])
+Spectrum.__doc__ = """The result of `spectrum`.
+
+`eigenvalues` are sorted by decreasing real part and `eigenvectors` holds the
+matching right eigenvectors as columns, or is None if they weren't asked for.
+`gap` is the spectral gap, -Re eigenvalues[1], and `relaxation_time` its
+inverse. `elapsed` is the wall clock time taken in seconds.
+"""
+
+
+def spectrum(generator, k=2, vectors=False, method='auto', sigma=None,
+             tol=0, maxiter=None):
+    """spectrum(generator[, k[, vectors[, method[, sigma[, tol[,
+    maxiter]]]]]]) -> a Spectrum
+
+    Finds the k eigenvalues with the largest real parts of the given sparse
+    generator matrix, or `polymer_states.matrix_free.GeneratorOperator`,
+    using one of `METHODS`:
+
+    * 'arnoldi' runs ARPACK on the generator itself,
+    * 'shift-invert' runs ARPACK on the inverse of the generator shifted by
+      sigma, which finds the eigenvalues nearest sigma quickly but needs a
+      sparse LU factorization. Those needn't be the ones with the largest
+      real parts when some have large imaginary parts, so 2 k + 2 of them
+      are found and the k with the largest real parts kept,
+    * 'auto' picks 'shift-invert' for sparse matrices of up to
+      `polymer_states.stationary.DIRECT_STATE_LIMIT` states and 'arnoldi'
+      otherwise.
+
+    sigma defaults to a thousandth of the largest exit rate. A tol of zero
+    means machine precision.
+    """
+    if method not in METHODS:
+        raise ValueError("unknown method {!r}".format(method))
+    if not 2 <= k < generator.shape[0] - 1:
+        raise ValueError(
+            "k must be at least 2 and less than the state count minus one")
+
+    is_operator = isinstance(generator, scipy.sparse.linalg.LinearOperator)
+    if not is_operator:
+        generator = scipy.sparse.csr_matrix(generator)
+    elif method == 'shift-invert':
+        raise ValueError("the 'shift-invert' method needs a sparse matrix")
+    if method == 'auto':
+        method = ('shift-invert' if not is_operator
+                  and generator.shape[0] <= stationary.DIRECT_STATE_LIMIT
+                  else 'arnoldi')
+
+    start = time.perf_counter()
+    if method == 'arnoldi':
+        values, found = scipy.sparse.linalg.eigs(
+            generator, k, which='LR', tol=tol, maxiter=maxiter,
+            return_eigenvectors=True)
+    else:
+        if sigma is None:
+            sigma = 1e-3 * numpy.abs(generator.diagonal()).max()
+        # Eigenvalues are found by distance to sigma, so ask for spares to
+        # rank by real part.
+        values, found = scipy.sparse.linalg.eigs(
+            generator.tocsc(), min(2 * k + 2, generator.shape[0] - 2),
+            sigma=sigma, which='LM', tol=tol, maxiter=maxiter,
+            return_eigenvectors=True)
+
+    order = numpy.argsort(-values.real, kind='stable')[:k]
+    values, found = values[order], found[:, order]
+    gap = -float(values[1].real)
+    return Spectrum(
+        values, found if vectors else None, gap,
+        1 / gap if gap > 0 else float('inf'),
+        time.perf_counter() - start, method)
+
+
+def relaxation_time(link_count, move_rates, bias=1.0, matrix_free=False,
+                    **options):
+    """relaxation_time(link_count, move_rates[, bias[, matrix_free, ...]])
+        -> a Spectrum
+
+    Computes the slowest relaxation modes of link_count link chains, building
+    the sparse generator or, with matrix_free set, a
+    `polymer_states.matrix_free.GeneratorOperator`. See `polymer_states.field`
+    for the meaning of bias. Remaining keyword arguments go to `spectrum`.
+    """
+    if matrix_free:
+        generator = GeneratorOperator(link_count, move_rates, bias)
+    elif bias == 1:
+        generator, _ = sparse.transition_matrix(
+            link_count, move_rates, diagonal=True)
+    else:
+        matrices, _ = field.field_matrices(link_count)
+        generator = field.combine(matrices, move_rates, bias, diagonal=True)
+    return spectrum(generator, **options)
@@ -0,0 +1,212 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Stationary distributions of the polymer Markov chain.
+
+The stationary distribution pi of a chain with generator matrix Q (see
+`polymer_states.sparse.with_diagonal`) solves pi Q = 0 with pi summing to
+one. Fixing the probability of the last state to one turns that into a
+nonsingular system over the remaining states, which is solved either by
+sparse LU factorization or by Jacobi preconditioned Krylov methods. Power
+iteration on the uniformized chain is available as a last resort needing
+nothing but matrix-vector products.
+
+Only products with Q's transpose are used by the iterative methods, and a CSR
+matrix's transpose is a free CSC view, so they need a few vectors of memory on
+top of the matrix itself. They also accept a matrix-free
+`polymer_states.matrix_free.GeneratorOperator` in place of the matrix.
+"""
+
+__all__ = ['METHODS', 'DIRECT_STATE_LIMIT', 'StationaryResult',
+           'stationary_distribution', 'residual', 'tolerance_keyword']
+
+
+import collections
+import inspect
+import time
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+METHODS = ('auto', 'direct', 'gmres', 'bicgstab', 'power')
+
+# The largest state count for which the 'auto' method factorizes the matrix.
+# Fill-in makes the factors nearly dense, so this has to stay small.
+DIRECT_STATE_LIMIT = 5 ** 5
+
+
+StationaryResult = collections.namedtuple(
+    'StationaryResult',
+    ['distribution', 'residual', 'iterations', 'elapsed', 'method'])
+StationaryResult.__doc__ = """The result of `stationary_distribution`.
+
+`residual` is the largest absolute entry of pi Q, `iterations` the number of
+products with the generator an iterative method needed (zero for 'direct')
+and `elapsed` the wall clock time taken in seconds.
+"""
+
+
+def residual(generator, distribution):
+    """residual(generator, distribution) -> float
+
+    Returns the largest absolute entry of distribution * generator.
+    """
+    return float(numpy.abs(generator.T.dot(distribution)).max())
+
+
+def tolerance_keyword(solver):
+    """tolerance_keyword(solver) -> str
+
+    Returns the name of the relative tolerance argument of a
+    `scipy.sparse.linalg` Krylov solver, which SciPy renamed from 'tol' to
+    'rtol'.
+    """
+    return ('rtol' if 'rtol' in inspect.signature(solver).parameters
+            else 'tol')
+
+
+def stationary_distribution(generator, method='auto', tol=1e-10,
+                            maxiter=None, initial=None):
+    """stationary_distribution(generator[, method[, tol[, maxiter[,
+    initial]]]]) -> a StationaryResult
+
+    Computes the stationary distribution of an irreducible chain with the
+    given sparse generator matrix using one of `METHODS`:
+
+    * 'direct' solves the system with a sparse LU factorization,
+    * 'gmres' and 'bicgstab' use the Krylov method of that name, with tol
+      being the relative tolerance,
+    * 'power' iterates the uniformized chain until the residual drops below
+      tol times the largest exit rate,
+    * 'auto' picks 'direct' for up to `DIRECT_STATE_LIMIT` states and
+      'bicgstab' otherwise, falling back to 'power' should it fail.
+
+    `initial` is an optional starting guess for the iterative methods. It's
+    ignored if it has non-finite entries, and by the Krylov methods if its
+    last entry isn't positive. A RuntimeError is raised should the result not
+    be finite.
+
+    The generator may also be a LinearOperator with a diagonal() method, such
+    as a `polymer_states.matrix_free.GeneratorOperator`, which rules out
+    'direct'.
+    """
+    if method not in METHODS:
+        raise ValueError("unknown method {!r}".format(method))
+
+    matrix_free = isinstance(generator, scipy.sparse.linalg.LinearOperator)
+    if not matrix_free:
+        generator = scipy.sparse.csr_matrix(generator)
+    elif method == 'direct':
+        raise ValueError("the 'direct' method needs a sparse matrix")
+
+    start = time.perf_counter()
+    if method == 'auto':
+        if not matrix_free and generator.shape[0] <= DIRECT_STATE_LIMIT:
+            method = 'direct'
+        else:
+            distribution, iterations, converged = _krylov(
+                generator, 'bicgstab', tol, maxiter, initial)
+            method = 'bicgstab'
+            if not converged:
+                distribution, more, _ = _power(
+                    generator, tol, maxiter, distribution)
+                iterations += more
+                method = 'power'
+
+    if method == 'direct':
+        distribution, iterations = _direct(generator), 0
+    elif method in ('gmres', 'bicgstab'):
+        distribution, iterations, _ = _krylov(
+            generator, method, tol, maxiter, initial)
+    elif method == 'power':
+        distribution, iterations, _ = _power(generator, tol, maxiter, initial)
+
+    distribution = _normalized(distribution)
+    if not numpy.all(numpy.isfinite(distribution)):
+        raise RuntimeError(
+            "the {!r} method found no finite distribution".format(method))
+    return StationaryResult(
+        distribution, residual(generator, distribution), iterations,
+        time.perf_counter() - start, method)
+
+
+def _normalized(distribution):
+    distribution = numpy.abs(distribution)
+    return distribution / distribution.sum()
+
+
+def _direct(generator):
+    transposed = generator.T.tocsc()
+    reduced = transposed[:-1, :-1].tocsc()
+    rhs = -transposed[:-1, -1].toarray().ravel()
+    factors = scipy.sparse.linalg.splu(reduced, permc_spec='MMD_AT_PLUS_A')
+    head = factors.solve(rhs)
+    return numpy.append(head, 1.0)
+
+
+def _krylov(generator, method, tol, maxiter, initial):
+    """Solves the system reduced by fixing the last state's probability with
+    a Jacobi preconditioned Krylov method. Returns the unnormalized
+    distribution, the number of products with the generator and whether the
+    method converged.
+    """
+    state_count = generator.shape[0]
+    transposed = generator.T
+    products = [0]
+
+    def matvec(head):
+        products[0] += 1
+        full = numpy.append(numpy.ravel(head), 0.0)
+        return transposed.dot(full)[:-1]
+
+    reduced = scipy.sparse.linalg.LinearOperator(
+        (state_count - 1, state_count - 1), matvec=matvec, dtype=numpy.float64)
+    last = numpy.zeros(state_count)
+    last[-1] = 1.0
+    rhs = -transposed.dot(last)[:-1]
+
+    diagonal = generator.diagonal()[:-1]
+    preconditioner = scipy.sparse.linalg.LinearOperator(
+        reduced.shape, matvec=lambda x: numpy.ravel(x) / diagonal,
+        dtype=numpy.float64)
+
+    guess = numpy.ones(state_count - 1)
+    if initial is not None:
+        initial = numpy.asarray(initial, dtype=numpy.float64)
+        # The guess is scaled to the last state's fixed probability, so an
+        # initial one without a positive last entry is no use.
+        if initial[-1] > 0 and numpy.all(numpy.isfinite(initial)):
+            guess = initial[:-1] / initial[-1]
+
+    solver = getattr(scipy.sparse.linalg, method)
+    head, info = solver(reduced, rhs, x0=guess, maxiter=maxiter,
+                        M=preconditioner, **{tolerance_keyword(solver): tol})
+    return numpy.append(head, 1.0), products[0], info == 0
+
+
+def _power(generator, tol, maxiter, initial):
+    """Iterates the uniformized chain P = I + Q / rate. Returns the
+    unnormalized distribution, the number of iterations and whether it
+    converged.
+    """
+    state_count = generator.shape[0]
+    transposed = generator.T
+    rate = 1.01 * numpy.abs(generator.diagonal()).max()
+    if maxiter is None:
+        maxiter = 100 * state_count
+
+    distribution = numpy.full(state_count, 1.0 / state_count)
+    if initial is not None:
+        initial = numpy.abs(numpy.asarray(initial, dtype=numpy.float64))
+        if numpy.all(numpy.isfinite(initial)) and initial.sum() > 0:
+            distribution = initial / initial.sum()
+
+    for iteration in range(1, maxiter + 1):
+        flow = transposed.dot(distribution)
+        distribution += flow / rate
+        if numpy.abs(flow).max() < tol * rate:
+            return distribution, iteration, True
+    return distribution, maxiter, False
@@ -0,0 +1,177 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""On-disk cache of enumerated states and per move type structure matrices.
+
+Every chain length gets a directory of plain `.npy` files, which are memory
+mapped when loaded. The directories live under a version directory named
+after `FORMAT_VERSION` and a fingerprint of `PAIR_TRANSITIONS`, so changing
+either the file layout or the move rules makes older entries invisible.
+`purge_stale` removes them.
+
+The cache is found under the directory named by the `POLYMER_STATES_CACHE`
+environment variable, or `~/.cache/polymer_states` by default.
+"""
+
+__all__ = ['FORMAT_VERSION', 'CACHE_DIR_ENV', 'default_cache_dir',
+           'rules_fingerprint', 'version_dir', 'save_structure',
+           'load_structure', 'move_type_matrices', 'purge_stale']
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy
+import scipy.sparse
+
+from polymer_states import MoveType, PAIR_TRANSITIONS
+from polymer_states import enumeration, incremental, sparse
+
+
+FORMAT_VERSION = 1
+
+CACHE_DIR_ENV = 'POLYMER_STATES_CACHE'
+
+_CSR_PARTS = ('data', 'indices', 'indptr')
+
+
+def default_cache_dir():
+    """default_cache_dir() -> str
+
+    Returns the cache directory to use when none is given explicitly.
+    """
+    return os.environ.get(
+        CACHE_DIR_ENV,
+        os.path.join(os.path.expanduser('~'), '.cache', 'polymer_states'))
+
+
+def rules_fingerprint():
+    """rules_fingerprint() -> str
+
+    Returns a short digest of the move rules in `PAIR_TRANSITIONS`.
+    """
+    def link_value(link):
+        return 0 if link is None else int(link)
+
+    rules = sorted(
+        (tuple(map(link_value, pair)),
+         tuple((tuple(map(link_value, new_pair)), int(move_type))
+               for new_pair, move_type in moves))
+        for pair, moves in PAIR_TRANSITIONS.items())
+    return hashlib.sha1(repr(rules).encode('ascii')).hexdigest()[:16]
+
+
+def version_dir(cache_dir=None):
+    """version_dir([cache_dir]) -> str
+
+    Returns the directory holding the entries valid for the current format
+    version and move rules.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(
+        cache_dir, 'v{}-{}'.format(FORMAT_VERSION, rules_fingerprint()))
+
+
+def _entry_dir(link_count, cache_dir):
+    return os.path.join(version_dir(cache_dir), 'n{}'.format(link_count))
+
+
+def _part_file(move_type, part):
+    return '{}.{}.npy'.format(int(move_type), part)
+
+
+def save_structure(link_count, matrices, states, cache_dir=None):
+    """save_structure(link_count, matrices, states[, cache_dir])
+
+    Stores the state codes and per move type CSR matrices of link_count link
+    chains, as returned by `polymer_states.sparse.move_type_matrices`. The
+    entry appears atomically, so concurrent readers never see it half written.
+    """
+    entry = _entry_dir(link_count, cache_dir)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    staging = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix='.tmp-')
+    try:
+        numpy.save(os.path.join(staging, 'states.npy'), states)
+        for move_type, matrix in matrices.items():
+            matrix = matrix.tocsr()
+            for part in _CSR_PARTS:
+                numpy.save(os.path.join(staging, _part_file(move_type, part)),
+                           getattr(matrix, part))
+        os.rename(staging, entry)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(entry):
+            raise
+
+
+def load_structure(link_count, cache_dir=None, mmap_mode='r'):
+    """load_structure(link_count[, cache_dir[, mmap_mode]])
+        -> (dict, state codes) or None
+
+    Loads what `save_structure` stored for link_count link chains, memory
+    mapping the arrays with the given `numpy.load` mmap_mode. Returns None if
+    there is no valid entry.
+    """
+    entry = _entry_dir(link_count, cache_dir)
+    if not os.path.isdir(entry):
+        return None
+
+    def load(name):
+        return numpy.load(os.path.join(entry, name), mmap_mode=mmap_mode)
+
+    states = load('states.npy')
+    matrices = {
+        move_type: scipy.sparse.csr_matrix(
+            tuple(load(_part_file(move_type, part)) for part in _CSR_PARTS),
+            shape=(len(states), len(states)), copy=False)
+        for move_type in sorted(MoveType.MOVE_TYPES)
+    }
+    return matrices, states
+
+
+def move_type_matrices(link_count, cache_dir=None):
+    """move_type_matrices(link_count[, cache_dir]) -> (dict, state codes)
+
+    Like `polymer_states.sparse.move_type_matrices`, but loads the result
+    from the cache when possible and stores it there otherwise. A missing
+    entry is built from the one of chains a link shorter if that is cached,
+    see `polymer_states.incremental.extend`.
+    """
+    cached = load_structure(link_count, cache_dir)
+    if cached is not None:
+        return cached
+
+    shorter = (load_structure(link_count - 1, cache_dir)
+               if link_count > 1 else None)
+    if shorter is not None:
+        matrices = incremental.extend(shorter[0])
+        states = enumeration.all_codes(link_count)
+    else:
+        matrices, states = sparse.move_type_matrices(link_count)
+    save_structure(link_count, matrices, states, cache_dir)
+    return matrices, states
+
+
+def purge_stale(cache_dir=None):
+    """purge_stale([cache_dir]) -> list of str
+
+    Removes the entries made for other format versions or move rules and
+    returns their paths.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+
+    current = os.path.basename(version_dir(cache_dir))
+    removed = []
+    for name in sorted(os.listdir(cache_dir)):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('v') and name != current and os.path.isdir(path):
+            shutil.rmtree(path)
+            removed.append(path)
+    return removed
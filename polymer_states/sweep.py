@@ -0,0 +1,246 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Parallel sweeps over the (h, c) parameters of the model.
+
+The rate independent structure of every chain length is built once, placed in
+shared memory and attached to by all the worker processes, which then only
+have to weigh it with the rates of the points they are given. What is
+computed at every point is an `Observable`, one of `OBSERVABLES` or any other.
+Results are written out as tab separated rows as soon as they come in.
+
+    $ python -m polymer_states.sweep -n 4 5 --h 0.1:1:10 --c 0.5,1 -o out.tsv
+"""
+
+__all__ = ['COLUMNS', 'Observable', 'stationary_averages', 'OBSERVABLES',
+           'parse_values', 'sweep']
+
+
+import collections
+import functools
+import itertools
+import multiprocessing
+import sys
+from argparse import ArgumentParser
+from multiprocessing import shared_memory
+
+import numpy
+import scipy.sparse
+
+from polymer_states import model_rates
+from polymer_states import codec, geometry, incremental, sparse, stationary
+from polymer_states import store
+
+
+# The columns describing every point, ahead of those of its observable.
+COLUMNS = ('link_count', 'h', 'c', 'states', 'transitions', 'total_rate',
+           'max_exit_rate')
+
+
+Observable = collections.namedtuple('Observable', ['columns', 'evaluate'])
+Observable.__doc__ = """Something `sweep` computes at every point.
+
+`evaluate(link_count, matrices, h, c)` is given the per move type count
+matrices of link_count link chains (see `sparse.move_type_matrices`) and
+returns one value per name in `columns`. It runs in the worker processes, so
+it has to be picklable, such as a module level function.
+"""
+
+
+def _no_values(link_count, matrices, h, c):
+    return ()
+
+
+# Per worker process: link count -> `geometry.all_observables` arrays.
+_GEOMETRY = {}
+
+
+def stationary_averages(link_count, matrices, h, c):
+    """stationary_averages(link_count, matrices, h, c) -> tuple
+
+    Returns the residual of the stationary distribution for the rates of h
+    and c, followed by the averages of the `geometry.OBSERVABLES` over it in
+    order of their names.
+    """
+    generator = sparse.combine(matrices, model_rates(h, c), diagonal=True)
+    result = stationary.stationary_distribution(generator)
+    if link_count not in _GEOMETRY:
+        _GEOMETRY[link_count] = geometry.all_observables(link_count)
+    values = _GEOMETRY[link_count]
+    return (result.residual,) + tuple(
+        float(values[name].dot(result.distribution))
+        for name in sorted(geometry.OBSERVABLES))
+
+
+OBSERVABLES = {
+    'none': Observable((), _no_values),
+    'stationary': Observable(
+        ('residual',) + tuple(sorted(geometry.OBSERVABLES)),
+        stationary_averages),
+}
+
+
+def parse_values(text):
+    """parse_values(text) -> list of floats
+
+    Parses either a comma separated list of values or a `start:stop:count`
+    grid of count evenly spaced values from start to stop, inclusive.
+    """
+    if ':' in text:
+        start, stop, count = text.split(':')
+        return list(numpy.linspace(float(start), float(stop), int(count)))
+    return [float(value) for value in text.split(',')]
+
+
+def _share(arrays):
+    """Copies a dictionary of arrays into a new shared memory block. Returns
+    the block and the layout `_attach` needs to find them in it.
+    """
+    layout, size = [], 0
+    for key, array in arrays.items():
+        layout.append((key, array.dtype.str, array.shape, size))
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for key, array in arrays.items():
+        _view(block, layout, key)[...] = array
+    return block, layout
+
+
+def _view(block, layout, key):
+    for name, dtype, shape, offset in layout:
+        if name == key:
+            return numpy.ndarray(shape, dtype, block.buf, offset)
+    raise KeyError(key)
+
+
+def _attach(name, layout):
+    block = shared_memory.SharedMemory(name=name)
+    return block, {key: _view(block, layout, key) for key, _, _, _ in layout}
+
+
+def _structure_arrays(matrices):
+    arrays = {}
+    for move_type, matrix in matrices.items():
+        arrays[move_type, 'data'] = matrix.data
+        arrays[move_type, 'indices'] = matrix.indices
+        arrays[move_type, 'indptr'] = matrix.indptr
+    return arrays
+
+
+def _structure_matrices(arrays, state_count):
+    move_types = {move_type for move_type, _ in arrays}
+    return {
+        move_type: scipy.sparse.csr_matrix(
+            (arrays[move_type, 'data'],
+             arrays[move_type, 'indices'],
+             arrays[move_type, 'indptr']),
+            shape=(state_count, state_count), copy=False)
+        for move_type in move_types
+    }
+
+
+# Per worker process: link count -> (shared memory block, structure).
+_STRUCTURES = {}
+
+
+def _attach_structures(shared):
+    for link_count, (name, layout, state_count) in shared.items():
+        block, arrays = _attach(name, layout)
+        _STRUCTURES[link_count] = (
+            block, _structure_matrices(arrays, state_count))
+
+
+def _evaluate(observable, point):
+    link_count, h, c = point
+    _, matrices = _STRUCTURES[link_count]
+    matrix = sparse.combine(matrices, model_rates(h, c))
+    exit_rates = numpy.asarray(matrix.sum(axis=1)).ravel()
+    return (link_count, h, c, matrix.shape[0], matrix.nnz,
+            exit_rates.sum(), exit_rates.max()) + tuple(
+                observable.evaluate(link_count, matrices, h, c))
+
+
+def _structures(link_counts, cache_dir):
+    if cache_dir is not None:
+        for link_count in link_counts:
+            yield link_count, store.move_type_matrices(
+                link_count, cache_dir)[0]
+    elif link_counts:
+        for link_count, matrices in incremental.ladder(
+                link_counts[-1], link_counts[0]):
+            if link_count in link_counts:
+                yield link_count, matrices
+
+
+def sweep(link_counts, hs, cs, out, processes=None, cache_dir=None,
+          observable='stationary'):
+    """sweep(link_counts, hs, cs, out[, processes[, cache_dir[,
+    observable]]])
+
+    Evaluates the observable, an `Observable` or the name of one of
+    `OBSERVABLES`, at every combination of link count, h and c on a pool of
+    `processes` worker processes, defaulting to one per core. The results
+    are written to the text file out as tab separated `COLUMNS` followed by
+    the observable's columns, in the order in which they finish.
+
+    The structures of the chain lengths are built by climbing
+    `polymer_states.incremental.ladder` from the shortest to the longest one.
+    When cache_dir is given, they are taken from and saved to the cache there
+    instead. See `polymer_states.store`.
+    """
+    if not isinstance(observable, Observable):
+        if observable not in OBSERVABLES:
+            raise ValueError("unknown observable {!r}".format(observable))
+        observable = OBSERVABLES[observable]
+
+    link_counts = sorted(set(link_counts))
+    blocks, shared = [], {}
+    try:
+        for link_count, matrices in _structures(link_counts, cache_dir):
+            block, layout = _share(_structure_arrays(matrices))
+            blocks.append(block)
+            shared[link_count] = (
+                block.name, layout, codec.state_count(link_count))
+
+        print(*COLUMNS + tuple(observable.columns), sep='\t', file=out)
+        points = itertools.product(sorted(shared), hs, cs)
+        evaluate = functools.partial(_evaluate, observable)
+        with multiprocessing.Pool(processes, _attach_structures,
+                                  (shared,)) as pool:
+            for row in pool.imap_unordered(evaluate, points):
+                print(*row, sep='\t', file=out)
+                out.flush()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+parser = ArgumentParser()
+parser.add_argument('--link-counts', '-n', metavar='LINK_COUNT', type=int,
+                    nargs='+', required=True)
+parser.add_argument('--h', metavar='H', type=parse_values, required=True,
+                    help='comma separated values or a START:STOP:COUNT grid')
+parser.add_argument('--c', metavar='C', type=parse_values, required=True,
+                    help='comma separated values or a START:STOP:COUNT grid')
+parser.add_argument('--observable', choices=sorted(OBSERVABLES),
+                    default='stationary',
+                    help="what to compute at every point "
+                         "(default: %(default)s)")
+parser.add_argument('--processes', '-p', metavar='PROCESSES', type=int)
+parser.add_argument('--out', '-o', metavar='OUT')
+parser.add_argument('--no-cache', action='store_true',
+                    help="don't use the on-disk structure cache")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    cache_dir = None if args.no_cache else store.default_cache_dir()
+    out = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        sweep(args.link_counts, args.h, args.c, out, args.processes,
+              cache_dir, args.observable)
+    finally:
+        if args.out:
+            out.close()
@@ -0,0 +1,159 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""State space reduction by lattice symmetries and chain reversal.
+
+The move rules commute with the rotations and reflections of the square
+lattice and, as the rates of a move don't depend on the end it happens at,
+with reading the chain backwards. Without a field the chain can therefore be
+lumped into orbits of states under those symmetries, each stood for by its
+representative: the orbit member with the smallest code.
+
+A symmetry is a pair of a link digit permutation and whether the chain is
+reversed. Reversal doesn't need to turn links around on its own, since that
+is the half turn rotation already in the group.
+"""
+
+__all__ = ['LATTICE_GROUP', 'FULL_GROUP', 'images', 'canonical',
+           'orbit_sizes', 'representatives', 'lumped_matrix', 'expand']
+
+
+import numpy
+
+from polymer_states import Link
+from polymer_states import codec, enumeration, kernel, sparse
+
+
+def _digit_permutation(mapping):
+    return tuple(
+        codec.DIGITS_BY_LINK[mapping.get(link, link)]
+        for link in codec.LINKS_BY_DIGIT)
+
+
+_QUARTER_TURN = _digit_permutation({
+    Link.UP: Link.LEFT, Link.LEFT: Link.DOWN,
+    Link.DOWN: Link.RIGHT, Link.RIGHT: Link.UP,
+})
+_MIRROR = _digit_permutation({Link.LEFT: Link.RIGHT, Link.RIGHT: Link.LEFT})
+
+
+def _closure(generators):
+    identity = tuple(range(codec.LINK_BASE))
+    group, new = {identity}, {identity}
+    while new:
+        new = {
+            tuple(g[i] for i in h) for g in generators for h in new
+        } - group
+        group |= new
+    return tuple(sorted(group))
+
+
+# The eight rotations and reflections of the square lattice.
+LATTICE_GROUP = tuple(
+    (permutation, False)
+    for permutation in _closure((_QUARTER_TURN, _MIRROR)))
+
+# The lattice symmetries combined with reversing the chain.
+FULL_GROUP = LATTICE_GROUP + tuple(
+    (permutation, True) for permutation, _ in LATTICE_GROUP)
+
+
+def images(codes, link_count, group=FULL_GROUP):
+    """images(codes, link_count[, group]) -> 2D array of codes
+
+    Returns the images of the states with the given codes under every
+    symmetry of group, one row per symmetry.
+    """
+    digits = codec.decode_digits(codes, link_count).reshape(-1, link_count)
+    return numpy.stack([
+        codec.encode_digits(
+            numpy.asarray(permutation, dtype=numpy.uint8)[
+                digits[:, ::-1] if reverse else digits])
+        for permutation, reverse in group
+    ])
+
+
+def canonical(codes, link_count, group=FULL_GROUP):
+    """canonical(codes, link_count[, group]) -> array of codes
+
+    Returns the representatives of the orbits of the given states.
+    """
+    return images(codes, link_count, group).min(axis=0)
+
+
+def orbit_sizes(codes, link_count, group=FULL_GROUP):
+    """orbit_sizes(codes, link_count[, group]) -> int array
+
+    Returns the number of distinct states in the orbits of the given states.
+    """
+    found = numpy.sort(images(codes, link_count, group), axis=0)
+    return 1 + numpy.count_nonzero(found[1:] != found[:-1], axis=0)
+
+
+def representatives(link_count, group=FULL_GROUP, chunk_size=1 << 20):
+    """representatives(link_count[, group[, chunk_size]]) -> array of codes
+
+    Returns the sorted codes of the representatives of all orbits, looking at
+    chunk_size states at a time.
+    """
+    found = []
+    for start in range(0, codec.state_count(link_count), chunk_size):
+        codes = enumeration.all_codes(
+            link_count, start,
+            min(start + chunk_size, codec.state_count(link_count)))
+        found.append(codes[canonical(codes, link_count, group) == codes])
+    return numpy.concatenate(found)
+
+
+def lumped_matrix(link_count, move_rates, group=FULL_GROUP, format='csr',
+                  diagonal=False, known_representatives=None):
+    """lumped_matrix(link_count, move_rates[, group[, format[, diagonal[,
+    known_representatives]]]]) -> (sparse matrix, representative codes)
+
+    Builds the transition matrix of the chain lumped into orbits. Entry
+    (a, b) is the total rate of going from the a-th representative into any
+    member of the b-th orbit, which is the same for all members of orbit a.
+    Moves between members of a single orbit don't change the lumped state, so
+    with diagonal set the diagonal only balances moves leaving the orbit.
+
+    Pass the result of `representatives` as known_representatives to reuse it
+    across calls.
+    """
+    if known_representatives is None:
+        known_representatives = representatives(link_count, group)
+    codes = known_representatives
+
+    sources, targets, move_types = kernel.transitions(codes, link_count)
+    targets = canonical(targets, link_count, group)
+    rates = kernel.rate_lookup(move_rates)[move_types]
+
+    matrix = sparse.from_transitions(
+        numpy.searchsorted(codes, sources), numpy.searchsorted(codes, targets),
+        rates, len(codes), format, diagonal)
+    return matrix, codes
+
+
+def expand(values, link_count, representatives, group=FULL_GROUP,
+           split=True, chunk_size=1 << 20):
+    """expand(values, link_count, representatives[, group[, split[,
+    chunk_size]]]) -> array
+
+    Turns values given per orbit, aligned with representatives, into values
+    for every state in canonical order. With split set, each orbit's value is
+    shared evenly between its members, which turns a distribution over orbits
+    into one over states. Otherwise every member gets the orbit's value.
+    """
+    values = numpy.asarray(values)
+    dtype = numpy.float64 if split else values.dtype
+    expanded = numpy.empty(codec.state_count(link_count), dtype=dtype)
+    for start in range(0, len(expanded), chunk_size):
+        codes = enumeration.all_codes(
+            link_count, start, min(start + chunk_size, len(expanded)))
+        orbits = numpy.searchsorted(
+            representatives, canonical(codes, link_count, group))
+        chunk = values[orbits]
+        if split:
+            chunk = chunk / orbit_sizes(codes, link_count, group)
+        expanded[start:start + len(codes)] = chunk
+    return expanded
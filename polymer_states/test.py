@@ -2,12 +2,29 @@
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import functools
+import io
+import os
+import shutil
+import tempfile
 
 import unittest
 from unittest.util import safe_repr
 import operator
 
-from polymer_states import Polymer, HERNIAS, Link, MoveType, TransitionMatrix
+import numpy
+import scipy.io
+import scipy.linalg
+import scipy.sparse
+
+from polymer_states import Polymer, HERNIAS, HERNIA_PAIRS, Link, MoveType
+from polymer_states import PAIR_TRANSITIONS, TRANSITION_CACHE, TransitionCache
+from polymer_states import TransitionMatrix
+from polymer_states import model_rates
+from polymer_states import codec, ensemble, enumeration, exploration, export
+from polymer_states import field, geometry, incremental, kernel, kmc
+from polymer_states import matrix_free, outofcore, passage, render, sparse
+from polymer_states import spectral, stationary, store, sweep, symmetry
+from polymer_states import transient
 
 
 class SetAssertions(unittest.TestCase):
@@ -447,3 +464,1340 @@ class PolymerTransitionMatrixTest(TransitionRates):
         matrix_states = matrix.states()
 
         self.assertEqual(all_states, matrix_states)
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_decode_inverts_encode(self):
+        for polymer in Polymer.all_with_n_links(3):
+            code = codec.encode(polymer.links())
+
+            self.assertEqual(codec.decode(code, 3), polymer.links())
+
+    def test_polymer_can_be_built_from_its_code(self):
+        polymer = Polymer([Link.UP, Link.SLACK, Link.RIGHT, Link.LEFT])
+
+        self.assertEqual(Polymer.from_code(polymer.code(), 4), polymer)
+
+    def test_codes_sort_like_polymers(self):
+        polymers = sorted(Polymer.all_with_n_links(3))
+
+        codes = [polymer.code() for polymer in polymers]
+
+        self.assertEqual(codes, list(range(codec.state_count(3))))
+
+    def test_bulk_codec_matches_scalar_codec(self):
+        polymers = sorted(Polymer.all_with_n_links(3))
+        codes = codec.encode_polymers(polymers)
+
+        digits = codec.decode_digits(codes, 3)
+
+        self.assertEqual(codes.dtype, numpy.uint32)
+        self.assertTrue(numpy.array_equal(codec.encode_digits(digits), codes))
+        self.assertEqual(codec.decode_polymers(codes, 3), polymers)
+
+    def test_wide_chains_use_64_bit_codes(self):
+        self.assertEqual(codec.code_dtype(13), numpy.uint32)
+        self.assertEqual(codec.code_dtype(14), numpy.uint64)
+        self.assertRaises(ValueError, codec.code_dtype, codec.MAX_LINK_COUNT + 1)
+
+    def test_text_codec(self):
+        polymer = Polymer([Link.UP, Link.SLACK, Link.RIGHT, Link.LEFT])
+
+        self.assertEqual(codec.decode_text([polymer.code()], 4), ['USRL'])
+        self.assertEqual(codec.encode_text(['USRL']).tolist(),
+                         [polymer.code()])
+        self.assertEqual(codec.decode_text(
+            codec.encode_text(['DD', 'SL']), 2), ['DD', 'SL'])
+        self.assertRaises(ValueError, codec.encode_text, ['UX'])
+        self.assertRaises(ValueError, codec.encode_text, ['U', 'UU'])
+
+
+class EnumerationTest(unittest.TestCase):
+
+    def test_all_states_are_the_reachable_states_in_sorted_order(self):
+        for length in range(1, 4):
+            states = enumeration.all_states(length)
+
+            self.assertEqual(states, sorted(Polymer.all_with_n_links(length)))
+
+    def test_unrank_inverts_rank(self):
+        for i, polymer in enumerate(enumeration.iter_states(3)):
+            self.assertEqual(enumeration.rank(polymer), i)
+            self.assertEqual(enumeration.unrank(i, 3), polymer)
+
+    def test_iter_states_yields_the_requested_range(self):
+        states = list(enumeration.iter_states(3, 10, 20))
+
+        self.assertEqual(states, enumeration.all_states(3)[10:20])
+        self.assertTrue(numpy.array_equal(
+            enumeration.all_codes(3, 10, 20), numpy.arange(10, 20)))
+
+    def test_invalid_ranges_are_rejected(self):
+        self.assertRaises(ValueError, enumeration.all_codes, 2, 0, 26)
+        self.assertRaises(ValueError, enumeration.all_codes, 2, 5, 4)
+
+    def test_state_range_defaults_to_all_states(self):
+        self.assertEqual(enumeration.state_range(2), (0, 25))
+        self.assertEqual(enumeration.state_range(2, 3, 7), (3, 7))
+        self.assertRaises(ValueError, enumeration.state_range, 2, -1)
+
+    def test_code_chunks_cover_the_range(self):
+        chunks = list(enumeration.iter_code_chunks(3, 10, 30, chunk_size=8))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [8, 8, 4])
+        numpy.testing.assert_array_equal(
+            numpy.concatenate(chunks), numpy.arange(10, 30))
+
+    def test_write_states_in_text_formats(self):
+        expected = {
+            'repr': [repr(p) for p in enumeration.all_states(2)[3:9]],
+            'text': ['UR', 'US', 'DU', 'DD', 'DL', 'DR'],
+            'codes': [str(i) for i in range(3, 9)],
+        }
+        for format, lines in expected.items():
+            with self.subTest(format=format):
+                out = io.StringIO()
+
+                count = enumeration.write_states(
+                    out, 2, format, 3, 9, chunk_size=4)
+
+                self.assertEqual(count, 6)
+                self.assertEqual(out.getvalue().splitlines(), lines)
+
+    def test_write_states_as_npy(self):
+        out = io.BytesIO()
+
+        enumeration.write_states(out, 3, 'npy', 100, chunk_size=7)
+
+        out.seek(0)
+        codes = numpy.load(out)
+        self.assertEqual(codes.dtype, numpy.uint32)
+        numpy.testing.assert_array_equal(codes, numpy.arange(100, 125))
+        self.assertRaises(ValueError, enumeration.write_states,
+                          io.StringIO(), 2, 'csv')
+
+
+class SparseTransitionMatrixTest(TransitionRates):
+
+    def test_sparse_matrix_matches_transition_matrix(self):
+        matrix = Polymer.transition_matrix(3, self.MOVE_RATES)
+        sparse_matrix, states = Polymer.transition_matrix(
+            3, self.MOVE_RATES, sparse='csr')
+
+        polymers = codec.decode_polymers(states, 3)
+        dense = sparse_matrix.toarray()
+        for i, origin in enumerate(polymers):
+            for j, target in enumerate(polymers):
+                self.assertEqual(dense[i, j], matrix[origin, target])
+
+    def test_sparse_matrix_uses_compact_indices(self):
+        sparse_matrix, states = Polymer.transition_matrix(
+            3, self.MOVE_RATES, sparse='csr')
+
+        self.assertIsInstance(sparse_matrix, scipy.sparse.csr_matrix)
+        self.assertEqual(sparse_matrix.indices.dtype, numpy.int32)
+        self.assertEqual(states.dtype, numpy.uint32)
+
+    def test_diagonal_makes_a_generator_matrix(self):
+        generator, _ = Polymer.transition_matrix(
+            3, self.MOVE_RATES, sparse='coo', diagonal=True)
+
+        self.assertIsInstance(generator, scipy.sparse.coo_matrix)
+        self.assertTrue(numpy.allclose(generator.sum(axis=1), 0))
+        self.assertTrue(numpy.all(generator.diagonal() < 0))
+
+    def test_unknown_formats_are_rejected(self):
+        self.assertRaises(ValueError, Polymer.transition_matrix,
+                          2, self.MOVE_RATES, sparse='dok')
+
+
+class KernelTest(TransitionRates):
+
+    def assertKernelMatchesPolymers(self, link_count):
+        codes = enumeration.all_codes(link_count)
+
+        sources, targets, move_types = kernel.transitions(codes, link_count)
+
+        expected = {}
+        for polymer in enumeration.iter_states(link_count):
+            for target, rate in polymer.transition_rates(
+                    self.MOVE_RATES, operator.or_).items():
+                expected[polymer.code(), target.code()] = rate
+        found = {}
+        for source, target, move_type in zip(sources, targets, move_types):
+            key = int(source), int(target)
+            found[key] = found.get(key, 0) | int(move_type)
+        self.assertEqual(found, expected)
+
+    def test_kernel_matches_transition_rates(self):
+        for link_count in range(1, 5):
+            self.assertKernelMatchesPolymers(link_count)
+
+    def test_kernel_counts_every_move_like_transition_rates(self):
+        unit_rates = {move_type: 1 for move_type in MoveType.MOVE_TYPES}
+        for link_count in (1, 3):
+            matrix, states = Polymer.transition_matrix(
+                link_count, unit_rates, sparse='csr')
+
+            for polymer in enumeration.iter_states(link_count):
+                for target, rate in polymer.transition_rates(unit_rates).items():
+                    self.assertEqual(
+                        matrix[polymer.code(), target.code()], rate)
+
+    def test_kernel_handles_arbitrary_subsets(self):
+        codes = numpy.array([0, 7, 124], dtype=numpy.uint32)
+
+        sources, _, _ = kernel.transitions(codes, 3)
+
+        self.assertEqual(set(sources.tolist()), {0, 7, 124})
+        self.assertEqual(sources.dtype, numpy.uint32)
+
+
+class PairTransitionsTest(unittest.TestCase):
+
+    def test_table_covers_all_pairs_but_the_empty_one(self):
+        self.assertEqual(len(PAIR_TRANSITIONS), 6 * 6 - 1)
+        self.assertNotIn((None, None), PAIR_TRANSITIONS)
+
+    def test_slack_pair_turns_into_any_hernia(self):
+        moves = PAIR_TRANSITIONS[Link.SLACK, Link.SLACK]
+
+        self.assertEqual(
+            set(moves),
+            {(hernia, MoveType.HERNIA_CREATION) for hernia in HERNIA_PAIRS})
+
+    def test_straight_pair_cannot_move(self):
+        self.assertEqual(PAIR_TRANSITIONS[Link.UP, Link.UP], ())
+
+    def test_taut_end_can_contract_or_wiggle(self):
+        moves = PAIR_TRANSITIONS[Link.UP, None]
+
+        self.assertEqual(
+            set(moves),
+            {((Link.SLACK, None), MoveType.END_CONTRACTION)} |
+            {((link, None), MoveType.END_WIGGLE)
+             for link in Link.TAUT_LINKS - {Link.UP}})
+
+    def test_pair_table_arrays_match_table(self):
+        for (left, right), moves in PAIR_TRANSITIONS.items():
+            i = kernel.pair_ids(
+                kernel.NO_LINK if left is None else codec.DIGITS_BY_LINK[left],
+                kernel.NO_LINK if right is None else codec.DIGITS_BY_LINK[right])
+
+            self.assertEqual(kernel.PAIR_TABLE.counts[i], len(moves))
+            self.assertEqual(
+                [MoveType(m) for m in kernel.PAIR_TABLE.move_types[i, :len(moves)]],
+                [move_type for _, move_type in moves])
+
+
+class ExplorationTest(TransitionRates):
+
+    @staticmethod
+    def without_hernias(codes, link_count):
+        digits = codec.decode_digits(codes, link_count).astype(int)
+        opposite = numpy.array([1, 0, 3, 2, -1])
+        return ~numpy.any(
+            (digits[..., 1:] == opposite[digits[..., :-1]]), axis=-1)
+
+    def test_polymer_explore_expands_every_state_once(self):
+        start = Polymer.all_curled_up(3)
+
+        rates = Polymer.explore([start], self.MOVE_RATES, operator.or_)
+
+        self.assertEqual(set(rates), Polymer.all_with_n_links(3))
+        for polymer, polymer_rates in rates.items():
+            self.assertEqual(
+                polymer_rates,
+                polymer.transition_rates(self.MOVE_RATES, operator.or_))
+
+    def test_polymer_explore_respects_accept(self):
+        start = Polymer.all_curled_up(3)
+
+        rates = Polymer.explore(
+            [start], {}, accept=lambda polymer: not polymer.contains_hernia())
+
+        self.assertTrue(rates)
+        self.assertFalse(any(polymer.contains_hernia() for polymer in rates))
+        self.assertFalse(any(target.contains_hernia()
+                             for targets in rates.values()
+                             for target in targets))
+
+    def test_explore_finds_all_states_and_transitions(self):
+        start = [Polymer.all_curled_up(3).code()]
+
+        found = exploration.explore(start, 3)
+        matrix = exploration.transition_matrix(found, self.MOVE_RATES)
+
+        expected, _ = Polymer.transition_matrix(3, self.MOVE_RATES, sparse='csr')
+        self.assertTrue(numpy.array_equal(found.states, numpy.arange(125)))
+        self.assertEqual(abs(matrix - expected).max(), 0)
+
+    def test_explore_matches_polymer_explore_on_subsets(self):
+        start = Polymer([Link.UP, Link.SLACK, Link.RIGHT])
+        expected = Polymer.explore(
+            [start], {}, accept=lambda polymer: not polymer.contains_hernia())
+
+        found = exploration.explore(
+            [start.code()], 3, accept=lambda codes: self.without_hernias(codes, 3))
+
+        self.assertEqual(codec.decode_polymers(found.states, 3),
+                         sorted(expected))
+        self.assertEqual(len(found.sources),
+                         sum(len(targets) for targets in expected.values()))
+
+
+class TransitionCacheTest(TransitionRates):
+
+    def test_structure_counts_moves_leading_to_each_target(self):
+        polymer = Polymer([Link.SLACK])
+
+        structure = dict(polymer.transition_structure(TransitionCache()))
+
+        self.assertEqual(len(structure), 4)
+        for move_counts in structure.values():
+            self.assertEqual(move_counts, ((MoveType.END_EXTENSION, 2),))
+
+    def test_rates_are_evaluated_from_the_structure(self):
+        polymer = Polymer([Link.SLACK])
+
+        rates = polymer.transition_rates({MoveType.END_EXTENSION: 3})
+
+        self.assertEqual(set(rates.values()), {6})
+
+    def test_cache_counts_hits_and_misses(self):
+        cache = TransitionCache()
+        polymer = Polymer([Link.UP, Link.SLACK, Link.RIGHT])
+
+        polymer.transition_structure(cache)
+        polymer.transition_structure(cache)
+        Polymer(polymer.links()).transition_structure(cache)
+
+        self.assertEqual(cache.info(), (2, 1, 1 << 10, 1))
+
+    def test_cache_evicts_least_recently_used_states(self):
+        cache = TransitionCache(maxsize=2)
+        first, second, third = enumeration.all_states(2)[:3]
+
+        first.transition_structure(cache)
+        second.transition_structure(cache)
+        first.transition_structure(cache)
+        third.transition_structure(cache)
+        first.transition_structure(cache)
+        second.transition_structure(cache)
+
+        self.assertEqual(cache.info().hits, 2)
+        self.assertEqual(cache.info().misses, 4)
+        self.assertEqual(cache.info().currsize, 2)
+
+    def test_hits_return_the_cached_structure(self):
+        cache = TransitionCache()
+        polymer = Polymer([Link.UP, Link.SLACK, Link.RIGHT])
+
+        computed = polymer.transition_structure(cache)
+        cached = Polymer(polymer.links()).transition_structure(cache)
+
+        self.assertIs(cached, computed)
+
+    def test_explore_bypasses_the_global_cache(self):
+        TRANSITION_CACHE.clear()
+
+        Polymer.all_with_n_links(3)
+
+        self.assertEqual(TRANSITION_CACHE.info().currsize, 0)
+
+    def test_clear_empties_the_cache(self):
+        cache = TransitionCache()
+        Polymer.all_curled_up(3).transition_structure(cache)
+
+        cache.clear()
+
+        self.assertEqual(cache.info(), (0, 0, 1 << 10, 0))
+
+
+class MoveTypeMatricesTest(TransitionRates):
+
+    def test_there_is_a_matrix_for_every_move_type(self):
+        matrices, states = Polymer.transition_matrix(
+            3, {}, sparse='csr', by_move_type=True)
+
+        self.assertEqual(set(matrices), MoveType.MOVE_TYPES)
+        self.assertEqual(len(states), 125)
+
+    def test_by_move_type_defaults_to_csr(self):
+        matrices, states = Polymer.transition_matrix(2, {}, by_move_type=True)
+
+        self.assertTrue(scipy.sparse.isspmatrix_csr(matrices[MoveType.REPTATION]))
+        self.assertEqual(len(states), 25)
+
+    def test_flags_the_result_cannot_honour_are_rejected(self):
+        self.assertRaises(ValueError, Polymer.transition_matrix,
+                          2, self.MOVE_RATES, diagonal=True)
+        self.assertRaises(ValueError, Polymer.transition_matrix,
+                          2, {}, sparse='csr', diagonal=True, by_move_type=True)
+
+    def test_combined_matrices_match_transition_matrix(self):
+        matrices, _ = sparse.move_type_matrices(3)
+        expected, _ = Polymer.transition_matrix(
+            3, self.MOVE_RATES, sparse='csr', diagonal=True)
+
+        combined = sparse.combine(matrices, self.MOVE_RATES, diagonal=True)
+
+        self.assertAlmostEqual(abs(combined - expected).max(), 0)
+
+    def test_missing_move_types_have_zero_rate(self):
+        matrices, _ = sparse.move_type_matrices(2)
+
+        combined = sparse.combine(matrices, {MoveType.REPTATION: 2.0})
+
+        self.assertEqual(combined.nnz, matrices[MoveType.REPTATION].nnz)
+        self.assertTrue(numpy.all(combined.data == 2.0))
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_values_can_be_listed_or_gridded(self):
+        self.assertEqual(sweep.parse_values('0.5,1'), [0.5, 1.0])
+        self.assertEqual(sweep.parse_values('0:1:3'), [0.0, 0.5, 1.0])
+
+    def test_sweep_writes_a_row_per_point(self):
+        out = io.StringIO()
+
+        sweep.sweep([2, 3], [0.5, 1.0], [1.0], out, processes=2)
+
+        header, *rows = out.getvalue().splitlines()
+        self.assertEqual(header.split('\t'), list(
+            sweep.COLUMNS + sweep.OBSERVABLES['stationary'].columns))
+        self.assertEqual(
+            sorted(tuple(row.split('\t')[:3]) for row in rows),
+            [('2', '0.5', '1.0'), ('2', '1.0', '1.0'),
+             ('3', '0.5', '1.0'), ('3', '1.0', '1.0')])
+
+    def test_sweep_matches_direct_evaluation(self):
+        out = io.StringIO()
+        matrix, _ = Polymer.transition_matrix(
+            3, model_rates(0.5, 2.0), sparse='csr')
+
+        sweep.sweep([3], [0.5], [2.0], out, processes=1)
+
+        row = dict(zip(sweep.COLUMNS, out.getvalue().splitlines()[1].split('\t')))
+        self.assertEqual(int(row['transitions']), matrix.nnz)
+        self.assertAlmostEqual(float(row['total_rate']), matrix.sum())
+
+    def test_sweep_climbs_past_skipped_link_counts(self):
+        out = io.StringIO()
+        matrix, _ = sparse.transition_matrix(4, model_rates(0.5, 2.0))
+
+        sweep.sweep([4, 2], [0.5], [2.0], out, processes=1)
+
+        rows = [dict(zip(sweep.COLUMNS, line.split('\t')))
+                for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual(sorted(row['link_count'] for row in rows), ['2', '4'])
+        row, = [row for row in rows if row['link_count'] == '4']
+        self.assertEqual(int(row['transitions']), matrix.nnz)
+        self.assertAlmostEqual(float(row['total_rate']), matrix.sum())
+
+
+    def test_stationary_observables_match_direct_evaluation(self):
+        out = io.StringIO()
+        generator = sparse.combine(sparse.move_type_matrices(3)[0],
+                                   model_rates(0.5, 2.0), diagonal=True)
+        distribution = stationary.stationary_distribution(
+            generator).distribution
+        values = geometry.all_observables(3)
+
+        sweep.sweep([3], [0.5], [2.0], out, processes=1)
+
+        header, line = out.getvalue().splitlines()
+        row = dict(zip(header.split('\t'), line.split('\t')))
+        self.assertLess(float(row['residual']), 1e-8)
+        for name in geometry.OBSERVABLES:
+            self.assertAlmostEqual(float(row[name]),
+                                   values[name].dot(distribution))
+
+    def test_observables_can_be_plugged_in(self):
+        out = io.StringIO()
+        observable = sweep.Observable(('state_count',), _state_count)
+
+        sweep.sweep([2], [0.5], [2.0], out, processes=1,
+                    observable=observable)
+
+        header, line = out.getvalue().splitlines()
+        self.assertEqual(header.split('\t')[-1], 'state_count')
+        self.assertEqual(line.split('\t')[-1], '25')
+
+    def test_unknown_observables_are_rejected(self):
+        self.assertRaises(ValueError, sweep.sweep, [2], [0.5], [2.0],
+                          io.StringIO(), observable='drift')
+
+
+def _state_count(link_count, matrices, h, c):
+    # Module level, so the sweep's worker processes can unpickle it.
+    return (next(iter(matrices.values())).shape[0],)
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_missing_entries_load_as_none(self):
+        self.assertIsNone(store.load_structure(3, self.cache_dir))
+
+    def test_cached_structure_matches_built_one(self):
+        expected, expected_states = sparse.move_type_matrices(3)
+
+        store.move_type_matrices(3, self.cache_dir)
+        matrices, states = store.load_structure(3, self.cache_dir)
+
+        self.assertIsInstance(states, numpy.memmap)
+        self.assertTrue(numpy.array_equal(states, expected_states))
+        for move_type, matrix in expected.items():
+            self.assertEqual(abs(matrices[move_type] - matrix).max(), 0)
+
+    def test_missing_entries_extend_shorter_cached_ones(self):
+        expected, expected_states = sparse.move_type_matrices(3)
+        store.move_type_matrices(2, self.cache_dir)
+
+        matrices, states = store.move_type_matrices(3, self.cache_dir)
+
+        self.assertTrue(numpy.array_equal(states, expected_states))
+        for move_type, matrix in expected.items():
+            self.assertEqual(abs(matrices[move_type] - matrix).max(), 0)
+        self.assertIsNotNone(store.load_structure(3, self.cache_dir))
+
+    def test_entries_for_other_rules_are_stale(self):
+        store.move_type_matrices(2, self.cache_dir)
+        stale = os.path.join(self.cache_dir, 'v0-0123456789abcdef')
+        os.makedirs(os.path.join(stale, 'n2'))
+
+        removed = store.purge_stale(self.cache_dir)
+
+        self.assertEqual(removed, [stale])
+        self.assertIsNotNone(store.load_structure(2, self.cache_dir))
+
+    def test_sweep_can_use_the_cache(self):
+        out = io.StringIO()
+
+        sweep.sweep([2], [1.0], [1.0], out, processes=1,
+                    cache_dir=self.cache_dir)
+
+        self.assertIsNotNone(store.load_structure(2, self.cache_dir))
+
+
+class StationaryDistributionTest(unittest.TestCase):
+
+    @staticmethod
+    def generator(link_count, h=0.5, c=2.0):
+        matrices, _ = sparse.move_type_matrices(link_count)
+        return sparse.combine(matrices, model_rates(h, c), diagonal=True)
+
+    def test_single_link_chain_distribution(self):
+        # Slack links become taut at rate 2 per direction and taut ones become
+        # slack at rate 2h, so each taut link is 1/h times as likely.
+        result = stationary.stationary_distribution(self.generator(1))
+
+        slack = codec.DIGITS_BY_LINK[Link.SLACK]
+        expected = numpy.full(5, 2 / 9)
+        expected[slack] = 1 / 9
+        self.assertTrue(numpy.allclose(result.distribution, expected))
+        self.assertEqual(result.method, 'direct')
+
+    def test_all_methods_agree(self):
+        generator = self.generator(4)
+        expected = stationary.stationary_distribution(generator, 'direct')
+
+        for method in ('gmres', 'bicgstab', 'power'):
+            result = stationary.stationary_distribution(
+                generator, method, tol=1e-12)
+
+            self.assertTrue(numpy.allclose(
+                result.distribution, expected.distribution, atol=1e-9),
+                method)
+            self.assertGreater(result.iterations, 0)
+            self.assertLess(result.residual, 1e-8)
+
+    def test_result_is_a_probability_distribution(self):
+        result = stationary.stationary_distribution(self.generator(3))
+
+        self.assertAlmostEqual(result.distribution.sum(), 1)
+        self.assertTrue(numpy.all(result.distribution > 0))
+        self.assertGreaterEqual(result.elapsed, 0)
+
+    def test_unknown_methods_are_rejected(self):
+        self.assertRaises(ValueError, stationary.stationary_distribution,
+                          self.generator(1), 'lu')
+
+    def test_unusable_initial_guesses_are_ignored(self):
+        generator = self.generator(3)
+        expected = stationary.stationary_distribution(generator, 'direct')
+        initial = numpy.ones(125)
+        initial[-1] = 0
+
+        for method, guess in [('bicgstab', initial),
+                              ('power', numpy.zeros(125))]:
+            result = stationary.stationary_distribution(
+                generator, method, tol=1e-12, initial=guess)
+
+            self.assertTrue(numpy.allclose(
+                result.distribution, expected.distribution, atol=1e-9),
+                method)
+
+    def test_non_finite_results_are_rejected(self):
+        with numpy.errstate(all='ignore'):
+            self.assertRaises(
+                RuntimeError, stationary.stationary_distribution,
+                scipy.sparse.csr_matrix((2, 2)), 'power')
+
+
+class FieldTest(unittest.TestCase):
+
+    def test_reptation_displaces_the_repton_by_the_link_it_swaps(self):
+        codes = [Polymer([Link.SLACK, Link.RIGHT]).code()]
+
+        _, targets, move_types, displacements = kernel.transitions(
+            codes, 2, displacements=True)
+
+        reptations = move_types == MoveType.REPTATION
+        self.assertEqual(codec.decode(int(targets[reptations][0]), 2),
+                         (Link.RIGHT, Link.SLACK))
+        self.assertEqual(displacements[reptations].tolist(), [[1, 0]])
+
+    def test_end_moves_displace_the_end_repton(self):
+        codes = [Polymer([Link.RIGHT]).code()]
+
+        _, targets, move_types, displacements = kernel.transitions(
+            codes, 1, displacements=True)
+
+        contractions = displacements[move_types == MoveType.END_CONTRACTION]
+        # Contracting at the head moves the head right, at the tail left.
+        self.assertEqual(sorted(contractions.tolist()), [[-1, 0], [1, 0]])
+
+    def test_no_field_matches_plain_rates(self):
+        matrices, _ = field.field_matrices(3)
+        plain, _ = sparse.move_type_matrices(3)
+        rates = model_rates(0.5, 2.0)
+
+        combined = field.combine(matrices, rates, 1.0)
+
+        self.assertAlmostEqual(abs(combined - sparse.combine(plain, rates)).max(), 0)
+
+    def test_drift_vanishes_without_field_and_follows_it(self):
+        matrices, _ = field.field_matrices(3)
+        rates = model_rates(0.5, 2.0)
+
+        still = field.drift_velocity(3, rates, 1.0, matrices)
+        forward = field.drift_velocity(3, rates, 1.5, matrices)
+        backward = field.drift_velocity(3, rates, 1 / 1.5, matrices)
+
+        self.assertAlmostEqual(still.velocity, 0)
+        self.assertGreater(forward.velocity, 0)
+        self.assertAlmostEqual(backward.velocity, -forward.velocity)
+
+    def test_extrapolation_recovers_polynomial_limit(self):
+        link_counts = [4, 5, 6, 8]
+        values = [2 + 3 / n - 1 / n ** 2 for n in link_counts]
+
+        self.assertAlmostEqual(field.extrapolate(link_counts, values), 2)
+        self.assertRaises(ValueError, field.extrapolate, [4, 5], [1, 2])
+
+
+class SymmetryTest(unittest.TestCase):
+
+    def test_groups_have_the_expected_sizes(self):
+        self.assertEqual(len(symmetry.LATTICE_GROUP), 8)
+        self.assertEqual(len(symmetry.FULL_GROUP), 16)
+
+    def test_orbits_partition_the_state_space(self):
+        representatives = symmetry.representatives(4)
+
+        sizes = symmetry.orbit_sizes(representatives, 4)
+
+        self.assertEqual(sizes.sum(), 5 ** 4)
+        self.assertTrue(numpy.all(
+            symmetry.canonical(representatives, 4) == representatives))
+
+    def test_reversed_chains_share_an_orbit(self):
+        polymer = Polymer([Link.UP, Link.SLACK, Link.RIGHT])
+        reversed_polymer = Polymer([Link.LEFT, Link.SLACK, Link.DOWN])
+
+        self.assertEqual(
+            symmetry.canonical([polymer.code()], 3).tolist(),
+            symmetry.canonical([reversed_polymer.code()], 3).tolist())
+
+    def test_lumped_stationary_distribution_expands_exactly(self):
+        rates = model_rates(0.5, 2.0)
+        generator = sparse.combine(
+            sparse.move_type_matrices(4)[0], rates, diagonal=True)
+        expected = stationary.stationary_distribution(generator).distribution
+
+        lumped, representatives = symmetry.lumped_matrix(
+            4, rates, diagonal=True)
+        reduced = stationary.stationary_distribution(lumped).distribution
+
+        self.assertTrue(numpy.allclose(lumped.sum(axis=1), 0))
+        self.assertTrue(numpy.allclose(
+            symmetry.expand(reduced, 4, representatives), expected))
+
+    def test_expand_can_copy_orbit_values(self):
+        representatives = symmetry.representatives(2, symmetry.LATTICE_GROUP)
+
+        expanded = symmetry.expand(
+            numpy.arange(len(representatives)), 2, representatives,
+            symmetry.LATTICE_GROUP, split=False)
+
+        self.assertEqual(expanded.dtype, numpy.arange(1).dtype)
+        self.assertEqual(len(numpy.unique(expanded)), len(representatives))
+
+
+class FenwickTreeTest(unittest.TestCase):
+
+    WEIGHTS = [0.5, 0.0, 2.0, 1.0, 0.0, 3.5, 1.0]
+
+    def test_prefix_sums_follow_updates(self):
+        tree = kmc.FenwickTree(self.WEIGHTS)
+        weights = list(self.WEIGHTS)
+
+        for i, weight in [(1, 4.0), (5, 0.0), (0, 1.5)]:
+            tree.update(i, weight)
+            weights[i] = weight
+
+            for count in range(len(weights) + 1):
+                self.assertAlmostEqual(tree.prefix_sum(count),
+                                       sum(weights[:count]))
+
+    def test_find_locates_the_crossing_item(self):
+        tree = kmc.FenwickTree(self.WEIGHTS)
+
+        found = [tree.find(value) for value in (0.0, 0.49, 0.5, 2.6, 7.9, 8.0)]
+
+        self.assertEqual(found, [0, 0, 2, 3, 6, 6])
+
+
+class SimulationTest(unittest.TestCase):
+
+    def test_every_step_is_a_legal_move(self):
+        simulation = kmc.Simulation(
+            Polymer.all_curled_up(4), model_rates(0.5, 2.0), seed=1)
+
+        for _ in range(200):
+            before = simulation.polymer()
+            waited = simulation.step()
+
+            self.assertIn(simulation.polymer(), before.reachable_from())
+            self.assertGreater(waited, 0)
+
+    def test_runs_are_reproducible(self):
+        def run(seed):
+            simulation = kmc.Simulation(
+                Polymer.all_curled_up(6), model_rates(0.5, 2.0), seed=seed)
+            stats = simulation.run(500)
+            return simulation.polymer(), stats.time
+
+        self.assertEqual(run(7), run(7))
+
+    def test_drift_matches_exact_velocity(self):
+        rates = model_rates(0.5, 1.0)
+        simulation = kmc.Simulation(
+            Polymer.all_curled_up(3), rates, bias=1.5, seed=3)
+
+        stats = simulation.run(100000)
+
+        velocity = simulation.center_of_mass_shift()[0] / simulation.time()
+        expected = field.drift_velocity(3, rates, 1.5).velocity
+        self.assertAlmostEqual(velocity, expected, delta=0.1 * expected)
+        self.assertEqual(stats.steps, 100000)
+        self.assertGreater(stats.steps_per_second, 0)
+
+
+class EnsembleTest(unittest.TestCase):
+
+    def test_every_step_is_a_legal_move(self):
+        chains = ensemble.Ensemble(20, 4, model_rates(0.5, 2.0), seed=1)
+
+        for _ in range(50):
+            before = chains.polymers()
+            chains.step()
+
+            for old, new in zip(before, chains.polymers()):
+                self.assertIn(new, old.reachable_from())
+
+    def test_starts_from_initial_state(self):
+        initial = Polymer([Link.UP, Link.SLACK, Link.RIGHT])
+        chains = ensemble.Ensemble(3, 3, model_rates(1, 1), initial=initial)
+
+        self.assertEqual(chains.polymers(), [initial] * 3)
+        numpy.testing.assert_array_equal(chains.end_to_end(), [(1, 1)] * 3)
+
+    def test_runs_are_reproducible(self):
+        def run(seed):
+            chains = ensemble.Ensemble(10, 6, model_rates(0.5, 2.0), seed=seed)
+            chains.run(100)
+            return chains.polymers(), chains.stats().time
+
+        self.assertEqual(run(7), run(7))
+
+    def test_drift_matches_exact_velocity(self):
+        rates = model_rates(0.5, 1.0)
+        chains = ensemble.Ensemble(1000, 3, rates, bias=1.5, seed=3)
+
+        run = chains.run(200)
+        stats = chains.stats()
+
+        expected = field.drift_velocity(3, rates, 1.5).velocity
+        self.assertAlmostEqual(stats.drift, expected, delta=0.1 * expected)
+        self.assertLess(stats.drift_error, 0.1 * expected)
+        self.assertGreater(stats.diffusion, 0)
+        self.assertEqual(run.steps, 200)
+        self.assertAlmostEqual(run.time, stats.time)
+
+
+class GeneratorOperatorTest(unittest.TestCase):
+    MOVE_RATES = model_rates(0.5, 2.0)
+
+    def assert_products_match(self, operator, generator):
+        x = numpy.random.RandomState(0).rand(generator.shape[0])
+
+        numpy.testing.assert_allclose(operator.matvec(x), generator.dot(x))
+        numpy.testing.assert_allclose(operator.rmatvec(x), generator.T.dot(x))
+        numpy.testing.assert_allclose(operator.T.dot(x), generator.T.dot(x))
+        numpy.testing.assert_allclose(
+            operator.diagonal(), generator.diagonal())
+
+    def test_matches_sparse_generator(self):
+        generator, _ = sparse.transition_matrix(
+            4, self.MOVE_RATES, diagonal=True)
+        operator = matrix_free.GeneratorOperator(
+            4, self.MOVE_RATES, chunk_size=100)
+
+        self.assert_products_match(operator, generator)
+
+    def test_transposed_products_with_small_chunks(self):
+        generator, _ = sparse.transition_matrix(
+            3, self.MOVE_RATES, diagonal=True)
+        operator = matrix_free.GeneratorOperator(
+            3, self.MOVE_RATES, chunk_size=7)
+        x = numpy.random.RandomState(2).rand(125)
+
+        numpy.testing.assert_allclose(operator.rmatvec(x), generator.T.dot(x))
+        numpy.testing.assert_allclose(operator.T.dot(x), generator.T.dot(x))
+
+    def test_matches_biased_generator(self):
+        matrices, _ = field.field_matrices(3)
+        generator = field.combine(matrices, self.MOVE_RATES, 1.5, True)
+        operator = matrix_free.GeneratorOperator(3, self.MOVE_RATES, bias=1.5)
+
+        self.assert_products_match(operator, generator)
+
+    def test_stationary_distribution(self):
+        generator, _ = sparse.transition_matrix(
+            3, self.MOVE_RATES, diagonal=True)
+        operator = matrix_free.GeneratorOperator(3, self.MOVE_RATES)
+
+        result = stationary.stationary_distribution(operator, tol=1e-12)
+
+        expected = stationary.stationary_distribution(generator).distribution
+        numpy.testing.assert_allclose(result.distribution, expected,
+                                      atol=1e-10)
+        self.assertEqual(result.method, 'bicgstab')
+        self.assertRaises(ValueError, stationary.stationary_distribution,
+                          operator, 'direct')
+
+
+class SpectrumTest(unittest.TestCase):
+    MOVE_RATES = model_rates(0.5, 2.0)
+
+    def setUp(self):
+        self.generator, _ = sparse.transition_matrix(
+            3, self.MOVE_RATES, diagonal=True)
+        eigenvalues = numpy.linalg.eigvals(self.generator.toarray())
+        self.expected = eigenvalues[numpy.argsort(-eigenvalues.real)]
+
+    def test_methods_find_slowest_modes(self):
+        for method in ('arnoldi', 'shift-invert'):
+            with self.subTest(method=method):
+                result = spectral.spectrum(
+                    self.generator, 3, vectors=True, method=method)
+
+                numpy.testing.assert_allclose(
+                    result.eigenvalues, self.expected[:3], atol=1e-9)
+                self.assertAlmostEqual(result.gap, -self.expected[1].real)
+                self.assertAlmostEqual(result.relaxation_time,
+                                       -1 / self.expected[1].real)
+                for value, vector in zip(result.eigenvalues,
+                                         result.eigenvectors.T):
+                    numpy.testing.assert_allclose(
+                        self.generator.dot(vector), value * vector,
+                        atol=1e-9)
+
+    def test_shift_invert_ranks_by_real_part(self):
+        # -0.5 +- 3i lies further from the shift than -0.9 but relaxes
+        # slower, so it sets the gap.
+        generator = scipy.sparse.block_diag([
+            [[0.0]], [[-0.9]], [[-0.5, 3.0], [-3.0, -0.5]],
+            numpy.diag([-5.0, -6.0, -7.0, -8.0])], format='csr')
+
+        result = spectral.spectrum(generator, 2, method='shift-invert')
+
+        self.assertAlmostEqual(result.gap, 0.5)
+        self.assertEqual(len(result.eigenvalues), 2)
+
+    def test_matrix_free(self):
+        result = spectral.relaxation_time(3, self.MOVE_RATES, matrix_free=True)
+
+        self.assertEqual(result.method, 'arnoldi')
+        self.assertIsNone(result.eigenvectors)
+        self.assertAlmostEqual(result.gap, -self.expected[1].real)
+
+    def test_invalid_arguments(self):
+        operator = matrix_free.GeneratorOperator(2, self.MOVE_RATES)
+
+        self.assertRaises(ValueError, spectral.spectrum, self.generator, 1)
+        self.assertRaises(ValueError, spectral.spectrum, self.generator,
+                          method='lobpcg')
+        self.assertRaises(ValueError, spectral.spectrum, operator,
+                          method='shift-invert')
+
+
+class EvolveTest(unittest.TestCase):
+    MOVE_RATES = model_rates(0.5, 2.0)
+    TIMES = [0, 0.5, 2, 10]
+
+    def setUp(self):
+        self.generator, _ = sparse.transition_matrix(
+            3, self.MOVE_RATES, diagonal=True)
+        self.initial = transient.initial_distribution(
+            Polymer.all_curled_up(3), self.generator.shape[0])
+        dense = self.generator.toarray().T
+        self.expected = [
+            scipy.linalg.expm(dense * t).dot(self.initial) for t in self.TIMES]
+
+    def evolve(self, **options):
+        return list(transient.evolve(
+            self.generator, self.initial, self.TIMES, distributions=True,
+            **options))
+
+    def test_methods_match_matrix_exponential(self):
+        for method in ('expm_multiply', 'uniformization'):
+            with self.subTest(method=method):
+                points = self.evolve(method=method)
+
+                self.assertEqual([p.time for p in points], self.TIMES)
+                for point, expected in zip(points, self.expected):
+                    numpy.testing.assert_allclose(
+                        point.distribution, expected, atol=1e-12)
+
+    def test_tiny_tolerances(self):
+        eps = numpy.finfo(numpy.float64).eps
+        for tol in (0, 1e-17, eps):
+            self.assertRaises(ValueError, transient.evolve,
+                              self.generator, self.initial, self.TIMES,
+                              tol=tol)
+
+        points = self.evolve(tol=2 * eps)
+
+        for point, expected in zip(points, self.expected):
+            numpy.testing.assert_allclose(
+                point.distribution, expected, atol=1e-12)
+
+    def test_observables(self):
+        values = numpy.arange(self.generator.shape[0], dtype=numpy.float64)
+        points = self.evolve(observables={
+            'value': values, 'largest': lambda p: p.max()})
+
+        for point, expected in zip(points, self.expected):
+            self.assertAlmostEqual(point.observables['value'],
+                                   values.dot(expected))
+            self.assertAlmostEqual(point.observables['largest'],
+                                   expected.max())
+
+    def test_resumes_from_checkpoint(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        checkpoint = os.path.join(directory, 'checkpoint.npz')
+
+        evolution = transient.evolve(
+            self.generator, self.initial, self.TIMES, checkpoint=checkpoint)
+        next(evolution)
+        next(evolution)
+        evolution.close()
+        resumed = self.evolve(checkpoint=checkpoint)
+
+        self.assertEqual([p.time for p in resumed], self.TIMES[2:])
+        for point, expected in zip(resumed, self.expected[2:]):
+            numpy.testing.assert_allclose(point.distribution, expected,
+                                          atol=1e-12)
+        self.assertRaises(ValueError, transient.evolve,
+                          self.generator, self.initial, [1, 2],
+                          checkpoint=checkpoint)
+
+    def test_unsorted_times(self):
+        self.assertRaises(ValueError, transient.evolve,
+                          self.generator, self.initial, [2, 1])
+
+
+class FirstPassageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.generator, _ = sparse.transition_matrix(
+            3, model_rates(0.5, 2.0), diagonal=True)
+        self.target = passage.state_mask(
+            Polymer.contains_hernia, self.generator.shape[0])
+
+        outside = numpy.flatnonzero(~self.target)
+        reduced = self.generator.toarray()[numpy.ix_(outside, outside)]
+        first = numpy.linalg.solve(reduced, -numpy.ones(len(outside)))
+        second = numpy.linalg.solve(reduced, -2 * first)
+        self.expected = numpy.zeros((2, self.generator.shape[0]))
+        self.expected[:, outside] = first, second
+
+    def test_moments(self):
+        # The 36 hernia states go through the fundamental matrix only when
+        # the limit allows.
+        for method in passage.METHODS:
+            for schur_limit in (0, 36):
+                with self.subTest(method=method, schur_limit=schur_limit):
+                    solver = passage.FirstPassage(
+                        self.generator, method, schur_limit=schur_limit)
+
+                    moments = solver.moments(Polymer.contains_hernia, 2)
+
+                    numpy.testing.assert_allclose(
+                        moments, self.expected, rtol=1e-8, atol=1e-8)
+
+    def test_single_state_targets(self):
+        dense = self.generator.toarray()
+        for method in ('direct', 'bicgstab'):
+            solver = passage.FirstPassage(self.generator, method)
+            for state in (0, 62, 124):
+                with self.subTest(method=method, state=state):
+                    outside = numpy.flatnonzero(numpy.arange(125) != state)
+                    expected = numpy.zeros(125)
+                    expected[outside] = numpy.linalg.solve(
+                        dense[numpy.ix_(outside, outside)],
+                        -numpy.ones(len(outside)))
+
+                    moments = solver.moments([state])
+
+                    numpy.testing.assert_allclose(
+                        moments[0], expected, rtol=1e-7, atol=1e-7)
+
+    def test_targets_share_fundamental_matrix_columns(self):
+        solver = passage.FirstPassage(self.generator, cache_size=2)
+
+        solver.moments([5])
+        solver.moments([5, 9])
+        solver.moments([9, 30])
+
+        self.assertEqual(solver.cache_info(), (2, 3, 2, 2))
+        solver.clear_cache()
+        self.assertEqual(solver.cache_info(), (0, 0, 2, 0))
+
+    def test_mean_time_over_sources(self):
+        solver = passage.FirstPassage(self.generator)
+        sources = [Polymer.all_curled_up(3).code(), 7]
+
+        uniform = solver.mean_time(sources, self.target, 2)
+        weights = numpy.zeros(self.generator.shape[0])
+        weights[7] = 1
+        weighted = solver.mean_time(sources, self.target, weights=weights)
+
+        numpy.testing.assert_allclose(
+            uniform, self.expected[:, sources].mean(axis=1))
+        numpy.testing.assert_allclose(weighted, self.expected[:1, 7])
+
+    def test_state_mask(self):
+        mask = passage.state_mask([0, 3], 5)
+
+        self.assertEqual(mask.tolist(), [True, False, False, True, False])
+        self.assertIs(passage.state_mask(mask, 5), mask)
+        self.assertRaises(ValueError, passage.state_mask, mask, 6)
+        self.assertRaises(ValueError, passage.state_mask, lambda p: True, 6)
+
+    def test_invalid_sets(self):
+        solver = passage.FirstPassage(self.generator)
+        nothing = numpy.zeros(self.generator.shape[0], dtype=bool)
+
+        self.assertRaises(ValueError, solver.moments, nothing)
+        self.assertRaises(ValueError, solver.mean_time, nothing, self.target)
+        self.assertRaises(ValueError, solver.moments, self.target, 0)
+
+
+class GeometryTest(unittest.TestCase):
+    LINK_COUNT = 3
+
+    def setUp(self):
+        self.states = enumeration.all_states(self.LINK_COUNT)
+        self.codes = enumeration.all_codes(self.LINK_COUNT)
+
+    @staticmethod
+    def walk(polymer):
+        position = (0, 0)
+        found = [position]
+        for link in polymer.links():
+            dx, dy = link.vector()
+            position = (position[0] + dx, position[1] + dy)
+            found.append(position)
+        return found
+
+    def test_positions_follow_links(self):
+        found = geometry.positions(self.codes, self.LINK_COUNT)
+
+        for polymer, positions in zip(self.states, found):
+            self.assertEqual([tuple(p) for p in positions.tolist()],
+                             self.walk(polymer))
+
+    def test_observables_match_polymers(self):
+        found = geometry.all_observables(self.LINK_COUNT, chunk_size=7)
+
+        for i, polymer in enumerate(self.states):
+            positions = numpy.array(self.walk(polymer), dtype=numpy.float64)
+            end = positions[-1]
+            centered = positions - positions.mean(axis=0)
+            self.assertEqual(found['end_to_end_squared'][i], end.dot(end))
+            self.assertAlmostEqual(found['radius_of_gyration_squared'][i],
+                                   (centered ** 2).sum(axis=1).mean())
+            self.assertEqual(found['hernia_count'][i], sum(
+                Polymer.is_hernia(pair)
+                for pair in tuple(polymer.link_pairs())[1:-1]))
+            self.assertEqual(found['slack_count'][i],
+                             polymer.links().count(Link.SLACK))
+
+    def test_averages_over_distribution(self):
+        generator, _ = sparse.transition_matrix(
+            self.LINK_COUNT, model_rates(0.5, 2.0), diagonal=True)
+        distribution = stationary.stationary_distribution(
+            generator).distribution
+
+        hernias = geometry.hernia_count(self.codes, self.LINK_COUNT)
+
+        expected = sum(p for p, polymer in zip(distribution, self.states)
+                       if polymer.contains_hernia())
+        self.assertAlmostEqual(distribution.dot(hernias > 0), expected)
+
+    def test_unknown_observable(self):
+        self.assertRaises(ValueError, geometry.all_observables, 2, ['volume'])
+
+
+class RenderTest(unittest.TestCase):
+    MOVE_RATES = model_rates(0.5, 2.0)
+
+    def setUp(self):
+        self.matrix, _ = sparse.transition_matrix(3, self.MOVE_RATES)
+
+    def test_small_matrices_are_drawn_exactly(self):
+        expected = self.matrix.toarray()
+
+        numpy.testing.assert_array_equal(
+            render.rasterize_matrix(self.matrix, chunk_size=10), expected)
+        numpy.testing.assert_array_equal(
+            render.rasterize_transitions(3, self.MOVE_RATES, chunk_size=7),
+            expected)
+
+    def test_aggregates_blocks(self):
+        dense = self.matrix.toarray()[:120, :120].reshape(10, 12, 10, 12)
+
+        for aggregate, expected in [('max', dense.max(axis=(1, 3))),
+                                    ('sum', dense.sum(axis=(1, 3))),
+                                    ('count', (dense != 0).sum(axis=(1, 3)))]:
+            with self.subTest(aggregate=aggregate):
+                image = render.rasterize_matrix(
+                    self.matrix[:120, :120], 10, aggregate)
+                numpy.testing.assert_array_equal(image, expected)
+
+    def test_normalize(self):
+        image = numpy.array([[0.0, 1.0], [10.0, 100.0]])
+
+        numpy.testing.assert_allclose(
+            render.normalize(image), [[0, 0.01], [0.1, 1]])
+        numpy.testing.assert_allclose(
+            render.normalize(image, log=True), [[0, 0.1], [0.55, 1]])
+        numpy.testing.assert_array_equal(
+            render.normalize(numpy.zeros((2, 2)), log=True), 0)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, render.rasterize_matrix, self.matrix,
+                          aggregate='mean')
+        self.assertRaises(ValueError, render.rasterize_matrix, self.matrix, 0)
+
+
+class OutOfCoreTest(unittest.TestCase):
+    MOVE_RATES = model_rates(0.5, 2.0)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_matches_in_memory_matrix(self):
+        for link_count, diagonal in [(1, False), (1, True), (3, False),
+                                     (3, True)]:
+            with self.subTest(link_count=link_count, diagonal=diagonal):
+                path = os.path.join(
+                    self.directory, '{}-{}'.format(link_count, diagonal))
+                outofcore.build(link_count, self.MOVE_RATES, path,
+                                diagonal=diagonal, chunk_size=7)
+
+                matrix = outofcore.load(path)
+
+                expected, _ = sparse.transition_matrix(
+                    link_count, self.MOVE_RATES, diagonal=diagonal)
+                self.assertEqual(matrix.shape, expected.shape)
+                self.assertEqual(abs(matrix - expected).max(), 0)
+                self.assertTrue(matrix.has_sorted_indices)
+
+    def test_parts_are_memory_mapped(self):
+        outofcore.build(2, self.MOVE_RATES, self.directory)
+
+        matrix = outofcore.load(self.directory)
+
+        self.assertIsInstance(
+            numpy.load(os.path.join(self.directory, 'data.npy'),
+                       mmap_mode='r'), numpy.memmap)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['data.npy', 'indices.npy', 'indptr.npy'])
+        self.assertEqual(matrix.shape, (25, 25))
+
+    def test_keeps_chunks_on_request(self):
+        outofcore.build(2, self.MOVE_RATES, self.directory, keep_chunks=True,
+                        chunk_size=4)
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.directory, 'coo'))),
+            ['columns.bin', 'rates.bin', 'rows.bin'])
+
+
+class ExportTest(unittest.TestCase):
+    MOVE_RATES = model_rates(0.5, 2.0)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.matrix, self.states = sparse.transition_matrix(
+            3, self.MOVE_RATES)
+        self.move_type_matrices, _ = sparse.move_type_matrices(3)
+
+    def assert_same_matrix(self, matrix, expected):
+        self.assertEqual(matrix.shape, expected.shape)
+        self.assertEqual(abs(matrix - expected).max(), 0)
+
+    def test_container_round_trip(self):
+        path = os.path.join(self.directory, 'matrix.bin')
+        export.save(path, 3, self.matrix, self.states,
+                    self.move_type_matrices, {'h': 0.5}, chunk_size=100)
+
+        loaded = export.load(path)
+
+        self.assertEqual(loaded.link_count, 3)
+        numpy.testing.assert_array_equal(loaded.states, self.states)
+        self.assert_same_matrix(loaded.matrix, self.matrix)
+        self.assertEqual(sorted(loaded.move_type_matrices),
+                         sorted(self.move_type_matrices))
+        for move_type, counts in self.move_type_matrices.items():
+            self.assert_same_matrix(
+                loaded.move_type_matrices[move_type], counts)
+        self.assertEqual(export.read_index(path)['metadata'],
+                         {'h': 0.5, 'link_count': 3})
+
+    def test_single_chunk_arrays_are_memory_mapped(self):
+        path = os.path.join(self.directory, 'matrix.bin')
+        export.save(path, 3, self.matrix, self.states)
+
+        loaded = export.load(path)
+
+        self.assertIsInstance(loaded.states, numpy.memmap)
+        self.assertIsNone(loaded.move_type_matrices)
+        self.assert_same_matrix(loaded.matrix, self.matrix)
+
+    def test_rejects_other_files(self):
+        path = os.path.join(self.directory, 'other.bin')
+        with open(path, 'wb') as file:
+            file.write(b'\0' * 64)
+
+        self.assertRaises(ValueError, export.read_index, path)
+
+    def test_rejects_short_files(self):
+        path = os.path.join(self.directory, 'short.bin')
+        with open(path, 'wb') as file:
+            file.write(export.MAGIC)
+
+        self.assertRaises(ValueError, export.read_index, path)
+
+    def test_failed_writes_leave_no_file(self):
+        path = os.path.join(self.directory, 'failed.bin')
+
+        with self.assertRaises(KeyError):
+            with export.ContainerWriter(path) as writer:
+                writer.write_array('states', self.states)
+                raise KeyError('states')
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_matrix_market(self):
+        paths = export.export_matrix_market(
+            self.directory, 3, self.matrix, self.states,
+            self.move_type_matrices, chunk_size=7)
+
+        self.assertEqual(len(paths), 2 + len(self.move_type_matrices))
+        self.assert_same_matrix(
+            scipy.io.mmread(os.path.join(self.directory, 'rates.mtx')),
+            self.matrix)
+        self.assert_same_matrix(
+            scipy.io.mmread(os.path.join(self.directory, 'reptation.mtx')),
+            self.move_type_matrices[MoveType.REPTATION])
+        with open(os.path.join(self.directory, 'states.txt')) as file:
+            labels = file.read().splitlines()
+        self.assertEqual(labels, codec.decode_text(self.states, 3))
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def assert_same_counts(self, matrices, expected):
+        self.assertEqual(sorted(matrices), sorted(expected))
+        for move_type, counts in expected.items():
+            self.assertEqual(matrices[move_type].dtype, numpy.uint8)
+            self.assertEqual(
+                (matrices[move_type] != counts.astype(numpy.uint8)).nnz, 0)
+
+    def test_ladder_matches_direct_construction(self):
+        link_counts = []
+        for link_count, matrices in incremental.ladder(5):
+            expected, _ = sparse.move_type_matrices(link_count)
+            with self.subTest(link_count=link_count):
+                self.assert_same_counts(matrices, expected)
+            link_counts.append(link_count)
+
+        self.assertEqual(link_counts, [1, 2, 3, 4, 5])
+
+    def test_move_type_matrices(self):
+        matrices, states = incremental.move_type_matrices(4)
+
+        expected, expected_states = sparse.move_type_matrices(4)
+        self.assert_same_counts(matrices, expected)
+        numpy.testing.assert_array_equal(states, expected_states)
+
+    def test_pair_matrices_follow_pair_transitions(self):
+        for move_type in MoveType.MOVE_TYPES:
+            head = incremental.PAIR_MATRICES.head[move_type]
+            tail = incremental.PAIR_MATRICES.tail[move_type]
+            inner = incremental.PAIR_MATRICES.inner[move_type]
+            self.assertEqual(head.sum(), sum(
+                moved == move_type
+                for (left, _), moves in PAIR_TRANSITIONS.items()
+                if left is None for _, moved in moves))
+            self.assertEqual(tail.sum(), sum(
+                moved == move_type
+                for (_, right), moves in PAIR_TRANSITIONS.items()
+                if right is None for _, moved in moves))
+            self.assertEqual(inner.sum(), sum(
+                moved == move_type
+                for pair, moves in PAIR_TRANSITIONS.items()
+                if None not in pair for _, moved in moves))
+
+    def test_invalid_ranges(self):
+        self.assertRaises(ValueError, incremental.ladder, 3, 4)
+        self.assertRaises(ValueError, incremental.ladder, 3, 0)
+        self.assertRaises(ValueError, incremental.ladder,
+                          codec.MAX_LINK_COUNT + 1)
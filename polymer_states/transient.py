@@ -0,0 +1,185 @@
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Transient evolution of state distributions.
+
+A distribution p evolves under a generator matrix Q as dp/dt = Q^T p, so
+p(t) = exp(Q^T t) p(0). The evolution is carried out from one output time to
+the next either by `scipy.sparse.linalg.expm_multiply` or by uniformization:
+with a rate L at least as large as every exit rate, P = I + Q^T / L is a
+stochastic matrix and exp(Q^T t) is the Poisson(L t) weighted sum of powers
+of P. Uniformization needs nothing but products with Q^T, so it also works
+with a `polymer_states.matrix_free.GeneratorOperator`, and adds no error
+beyond cutting off the sum.
+
+Only the current distribution is kept. Observables are evaluated at every
+output time as they are reached, and the distribution can be saved to a
+checkpoint file from which an interrupted evolution resumes.
+"""
+
+__all__ = ['METHODS', 'MAX_UNIFORMIZED_SPAN', 'TransientPoint',
+           'initial_distribution', 'evolve']
+
+
+import collections
+import os
+
+import numpy
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+METHODS = ('auto', 'expm_multiply', 'uniformization')
+
+# The largest expected number of jumps uniformization handles in one go.
+# Longer spans are split, so that the Poisson weights don't underflow.
+MAX_UNIFORMIZED_SPAN = 100.0
+
+
+TransientPoint = collections.namedtuple(
+    'TransientPoint', ['time', 'observables', 'distribution'])
+TransientPoint.__doc__ = """An output of `evolve`.
+
+`observables` maps the names of the observables to their expected values at
+`time`. `distribution` is the distribution at that time, or None unless
+asked for.
+"""
+
+
+def initial_distribution(polymer_or_codes, state_count):
+    """initial_distribution(polymer_or_codes, state_count) -> array
+
+    Returns the distribution spread evenly over the given states, which can be
+    a single `Polymer` or an array of state codes.
+    """
+    if hasattr(polymer_or_codes, 'code'):
+        polymer_or_codes = [polymer_or_codes.code()]
+    codes = numpy.asarray(polymer_or_codes, dtype=numpy.int64)
+    distribution = numpy.zeros(state_count)
+    distribution[codes] = 1.0 / len(codes)
+    return distribution
+
+
+def evolve(generator, initial, times, observables=None, method='auto',
+           tol=1e-12, checkpoint=None, distributions=False):
+    """evolve(generator, initial, times[, observables[, method[, tol[,
+    checkpoint[, distributions]]]]]) -> iterator of TransientPoints
+
+    Evolves the initial distribution under the given sparse generator matrix,
+    or LinearOperator, and yields a `TransientPoint` for each of the times,
+    which have to be non-negative and sorted. Use one of `METHODS`;
+    'uniformization' cuts off the sum once the weight left out drops below
+    tol, which has to exceed the machine precision. 'auto' picks it, as it beats 'expm_multiply', which needs a sparse
+    matrix, by a factor of two or so on these chains.
+
+    observables maps names to either arrays of values per state, whose
+    expectations are taken, or functions of the distribution.
+
+    If checkpoint is a file name, the distribution is saved there at every
+    output time. If that file already exists, the evolution picks up after the
+    last time saved in it, without yielding the points up to it again.
+    With distributions set, points carry a copy of the distribution.
+
+    Bad arguments and checkpoints raise ValueError right away, not once the
+    first point is asked for.
+    """
+    if method not in METHODS:
+        raise ValueError("unknown method {!r}".format(method))
+    if not tol > numpy.finfo(numpy.float64).eps:
+        raise ValueError("tol must exceed the machine precision")
+    times = numpy.asarray(times, dtype=numpy.float64)
+    if len(times) and (times[0] < 0 or numpy.any(numpy.diff(times) < 0)):
+        raise ValueError("times must be non-negative and sorted")
+
+    is_operator = isinstance(generator, scipy.sparse.linalg.LinearOperator)
+    if not is_operator:
+        generator = scipy.sparse.csr_matrix(generator)
+    elif method == 'expm_multiply':
+        raise ValueError("the 'expm_multiply' method needs a sparse matrix")
+    if method == 'auto':
+        method = 'uniformization'
+    if observables is None:
+        observables = {}
+
+    distribution = numpy.array(initial, dtype=numpy.float64)
+    first, now = 0, 0.0
+    if checkpoint is not None and os.path.exists(checkpoint):
+        first, now, distribution = _load_checkpoint(
+            checkpoint, times, len(distribution))
+
+    return _evolve(generator, distribution, times, first, now, observables,
+                   method, tol, checkpoint, distributions)
+
+
+def _evolve(generator, distribution, times, first, now, observables, method,
+            tol, checkpoint, distributions):
+    transposed = generator.T
+    if method == 'uniformization':
+        rate = numpy.abs(generator.diagonal()).max()
+
+    for i in range(first, len(times)):
+        span = times[i] - now
+        if span > 0:
+            if method == 'expm_multiply':
+                distribution = scipy.sparse.linalg.expm_multiply(
+                    span * transposed, distribution)
+            else:
+                distribution = _uniformized(
+                    transposed, rate, distribution, span, tol)
+        now = times[i]
+
+        if checkpoint is not None:
+            _save_checkpoint(checkpoint, times[:i + 1], distribution)
+        yield TransientPoint(
+            now,
+            {name: _expectation(observable, distribution)
+             for name, observable in observables.items()},
+            distribution.copy() if distributions else None)
+
+
+def _expectation(observable, distribution):
+    if callable(observable):
+        return observable(distribution)
+    return float(numpy.dot(observable, distribution))
+
+
+def _uniformized(transposed, rate, distribution, span, tol):
+    if rate <= 0:
+        return distribution
+    steps = max(1, int(numpy.ceil(rate * span / MAX_UNIFORMIZED_SPAN)))
+    mean = rate * span / steps
+    for _ in range(steps):
+        term = distribution
+        weight = total = numpy.exp(-mean)
+        result = weight * term
+        # Rounding can keep total a few units short of one, so also stop
+        # far out in the Poisson tail.
+        jumps, limit = 0, mean + 10 * numpy.sqrt(mean) + 20
+        while 1 - total > tol and jumps < limit:
+            jumps += 1
+            term = term + transposed.dot(term) / rate
+            weight *= mean / jumps
+            result += weight * term
+            total += weight
+        distribution = result / total
+    return distribution
+
+
+def _save_checkpoint(path, times_done, distribution):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        numpy.savez(file, times=times_done, distribution=distribution)
+    os.replace(temporary, path)
+
+
+def _load_checkpoint(path, times, state_count):
+    with numpy.load(path) as saved:
+        times_done, distribution = saved['times'], saved['distribution']
+    if (len(distribution) != state_count or len(times_done) > len(times)
+            or not numpy.array_equal(times_done, times[:len(times_done)])):
+        raise ValueError(
+            "checkpoint {!r} doesn't match this evolution".format(path))
+    if not len(times_done):
+        return 0, 0.0, distribution
+    return len(times_done), float(times_done[-1]), distribution
@@ -13,11 +13,12 @@ setup(
         'Topic :: Scientific/Engineering :: Physics',
         'Intended Audience :: Other Audience',
     ],
+    python_requires='>=3.8',
     install_requires=[
-        'numpy >=1.9.1,<2',
-        'scipy >=0.16.0,<0.17.0',
-        'Pillow >=2.9.0,<3',
-        'matplotlib >=1.4.3,<2',
+        'numpy >=1.17',
+        'scipy >=1.3',
+        'Pillow >=6.2',
+        'matplotlib >=3.1',
     ],
     packages=['polymer_states'],
     url='http://github.com/szabba/applied-sims',